@@ -1,28 +1,25 @@
 import qcodes as qc
 
+# Only the drivers we subclass are imported here. All other drivers are
+# imported by the LazyStation when their instrument is first used (see
+# station.config)
 from qcodes.instrument_drivers.QDev.QDac import QDac
 from qcodes.instrument_drivers.stanford_research.SR830 import SR830
 from qcodes.instrument_drivers.stanford_research.SR830 import ChannelBuffer
-from qcodes.instrument_drivers.Keysight.Keysight_33500B import Keysight_33500B
 from qcodes.instrument_drivers.Keysight.Keysight_34465A import Keysight_34465A
-from qcodes.instrument_drivers.ZI.ZIUHFLI import ZIUHFLI
 from qcodes.instrument_drivers.devices import VoltageDivider
+from qcodes.instrument.parameter import ArrayParameter
 
 from qcodes.utils.configreader import Config
 
-import qcodes.instrument_drivers.tektronix.Keithley_2600 as keith
-import qcodes.instrument_drivers.rohde_schwarz.SGS100A as sg
-import qcodes.instrument_drivers.tektronix.AWG5014 as awg
-import qcodes.instrument_drivers.HP .HP8133A as hpsg
-import qcodes.instrument_drivers.rohde_schwarz.ZNB20 as vna
+from modules.Majorana.instrument_config import invalidate_settings
+from modules.Majorana.station_registry import LazyInstrument, LazyStation
+from modules.Majorana.virtual_gates import load_virtual_gates
 
 import logging
-import re
 import time
-from functools import partial
 
-
-from qcodes.instrument_drivers.oxford.mercuryiPS import MercuryiPS
+import numpy as np
 
 
 # A conductance buffer, needed for the faster 2D conductance measurements
@@ -56,6 +53,94 @@ class ConductanceBuffer(ChannelBuffer):
 
         return gs
 
+
+class StreamingConductanceBuffer(ArrayParameter):
+    """
+    A conductance buffer that is read while the buffer is being filled.
+
+    The points stored so far are fetched in binary (TRCB?) whenever poll is
+    called, e.g. from the trigger task of the inner loop, and converted to
+    conductance right away. The get at the end of a row then only fetches
+    the last few points.
+
+    Usage per row: start, then poll as often as convenient while
+    triggering, then get.
+    """
+
+    def __init__(self, name: str, instrument: 'SR830_T10', **kwargs):
+        super().__init__(name, shape=(1,), instrument=instrument,
+                         unit='e^2/h',
+                         setpoint_names=('Trigger',),
+                         setpoint_labels=('Trigger',),
+                         setpoint_units=('',),
+                         **kwargs)
+        self.label = '{} conductance'.format(instrument.name)
+        self.timeout = 10
+        self._data = np.zeros(1)
+        self._nread = 0
+        self._factor = 1
+
+    def start(self, npts):
+        """
+        Reset and start the lock-in buffer for a new row of npts points.
+        The conversion factor is fixed here, so the I/V gain and the
+        excitation must not change during the row.
+        """
+        if self._instrument.ch1_display() != 'X':
+            raise ValueError('Can not return conductance since X is not '
+                             'being measured on channel 1.')
+
+        resistance_quantum = 25.818e3  # (Ohm)
+        self._factor = (resistance_quantum / self._instrument.ivgain /
+                        self._instrument.amplitude_true())
+
+        self.shape = (npts,)
+        self._data = np.full(npts, np.nan)
+        self._nread = 0
+
+        self._instrument.buffer_reset()
+        self._instrument.buffer_start()
+
+    def _fetch(self, start, count):
+        # raw reads to avoid termination character issues with binary data
+        self._instrument.write('TRCB? 1,{},{}'.format(start, count))
+        rawdata = self._instrument.visa_handle.read_raw()
+        if len(rawdata) != 4*count:
+            raise RuntimeError('Expected {} bytes ({} points) from the '
+                               'lock-in buffer, got {}.'.format(4*count,
+                                                                count,
+                                                                len(rawdata)))
+        return np.frombuffer(rawdata, dtype='<f4', count=count)
+
+    def poll(self):
+        """
+        Fetch and convert the points acquired since the last poll
+
+        Returns:
+            int: The number of points read so far in this row
+        """
+        npts = self.shape[0]
+        stored = min(int(self._instrument.ask('SPTS?')), npts)
+        if stored > self._nread:
+            xarray = self._fetch(self._nread, stored-self._nread)
+            self._data[self._nread:stored] = xarray*self._factor
+            self._nread = stored
+
+        return self._nread
+
+    def get(self):
+        npts = self.shape[0]
+        t_start = time.perf_counter()
+        while self.poll() < npts:
+            if time.perf_counter() - t_start > self.timeout:
+                raise TimeoutError('Only {} of {} points arrived in the '
+                                   'lock-in buffer.'.format(self._nread,
+                                                            npts))
+            time.sleep(0.001)
+
+        return self._data.copy()
+
+
 # Subclass the SR830
 
 class SR830_T10(SR830):
@@ -64,6 +149,7 @@ class SR830_T10(SR830):
         - a Voltage divider
         - An I/V converter
         - A conductance buffer
+        - A streaming conductance buffer
     """
 
     def __init__(self, name, address, **kwargs):
@@ -89,6 +175,9 @@ class SR830_T10(SR830):
                            label='{} conductance'.format(self.name),
                            parameter_class=ConductanceBuffer)
 
+        self.add_parameter('conductance_stream',
+                           parameter_class=StreamingConductanceBuffer)
+
     def _get_conductance(self):
         """
         get_cmd for conductance parameter
@@ -115,7 +204,8 @@ class SR830_T10(SR830):
 
 class QDAC_T10(QDac):
     """
-    A QDac with three voltage dividers
+    A QDac with three voltage dividers and the virtual gates of the
+    config file (see virtual_gates.py)
     """
     def __init__(self, name, address, config, **kwargs):
         super().__init__(name, address, **kwargs)
@@ -152,13 +242,126 @@ class QDAC_T10(QDac):
         #                                  float(config.get('Gain settings',
         #                                                    'dc factor left')))
 
+        self.virtual_gates = None
+        load_virtual_gates(self, config)
+
+
+# A current buffer for the DMM, the DC analogue of the conductance buffer
+
+
+class CurrentBuffer(ArrayParameter):
+    """
+    A buffered version of the I/V converted current.
+
+    The DMM is armed for a number of samples (timer or externally
+    triggered), stores them internally while e.g. a QDac ramps, and the
+    whole array is fetched in one binary transfer and converted at once.
+
+    Usage per sweep: prepare (once), start, sweep, get.
+    """
+
+    def __init__(self, name: str, instrument: 'Keysight_34465A_T10',
+                 **kwargs):
+        super().__init__(name, shape=(1,), instrument=instrument,
+                         unit='pA',
+                         setpoint_names=('Sample',),
+                         setpoint_labels=('Sample',),
+                         setpoint_units=('',),
+                         **kwargs)
+        self.label = 'Current'
+        self.interval = None
+        self._old_autozero = None
+
+    def prepare(self, npts, nplc=1, interval=None):
+        """
+        Configure the DMM for buffered DC voltage acquisition
+
+        Args:
+            npts (int): The number of samples per sweep
+            nplc (float): The integration time in power line cycles
+            interval (Optional[float]): The time between samples (s). If
+                given, the samples are timed by the DMM after a single
+                trigger (start). If None, each sample waits for an
+                external trigger.
+
+        Call restore when done, since READ? (volt, ivconv) needs
+        immediate single-sample triggering.
+        """
+        dmm = self._instrument
+
+        dmm.write('CONF:VOLT:DC')
+        # CONF resets the measurement settings behind the driver's back
+        invalidate_settings(dmm)
+        dmm.NPLC(nplc)
+        # no auto zero, so that the samples are evenly spaced
+        self._old_autozero = dmm.autozero()
+        dmm.autozero('OFF')
+
+        if interval is None:
+            dmm.trigger_source('EXT')
+            dmm.trigger_count(npts)
+            dmm.sample_count(1)
+        else:
+            dmm.trigger_source('IMM')
+            dmm.trigger_count(1)
+            dmm.sample_source('TIM')
+            dmm.sample_timer(interval)
+            dmm.sample_count(npts)
+
+        self.interval = interval
+        self.shape = (npts,)
+
+    def restore(self):
+        """
+        Back to immediate, single-sample triggering (and the auto zero
+        setting from before prepare), as needed by volt and ivconv
+        """
+        dmm = self._instrument
+
+        dmm.trigger_source('IMM')
+        dmm.trigger_count(1)
+        dmm.sample_source('IMM')
+        dmm.sample_count(1)
+        if self._old_autozero is not None:
+            dmm.autozero(self._old_autozero)
+            self._old_autozero = None
+
+        self.interval = None
+
+    def start(self):
+        """
+        Arm the DMM. With a timer, the acquisition starts right away.
+        """
+        self._instrument.write('INIT')
+
+    def get(self):
+        dmm = self._instrument
+
+        # FETC? waits for the acquisition to finish
+        old_timeout = dmm.timeout()
+        if self.interval is not None:
+            dmm.timeout(max(old_timeout, 2*self.shape[0]*self.interval))
+
+        dmm.write('FORM:DATA REAL,64')
+        try:
+            volts = dmm.visa_handle.query_binary_values('FETC?',
+                                                        datatype='d',
+                                                        is_big_endian=True,
+                                                        container=np.array)
+        finally:
+            # the other parameters expect ASCII
+            dmm.write('FORM:DATA ASCII')
+            dmm.timeout(old_timeout)
+
+        return volts/dmm.iv_conv*1E12
+
 
 # Subclass the DMM
 
 
 class Keysight_34465A_T10(Keysight_34465A):
     """
-    A Keysight DMM with an added I-V converter
+    A Keysight DMM with an added I-V converter and a buffered current
     """
     def __init__(self, name, address, **kwargs):
         super().__init__(name, address, **kwargs)
@@ -171,6 +374,9 @@ class Keysight_34465A_T10(Keysight_34465A):
                            get_cmd=self._get_current,
                            set_cmd=None)
 
+        self.add_parameter('ivconv_buffer',
+                           parameter_class=CurrentBuffer)
+
     def _get_current(self):
         """
         get_cmd for dmm readout of IV_TAMP parameter
@@ -186,56 +392,31 @@ if __name__ == '__main__':
     config = Config('A:\qcodes_experiments\modules\Majorana\sample.config')
 
 
-    # Initialisation of intruments
-    qdac = QDAC_T10('qdac', 'ASRL6::INSTR', config, update_currents=False)
-    lockin_topo = SR830_T10('lockin_topo', 'GPIB10::7::INSTR')
-    lockin_left = SR830_T10('lockin_l', 'GPIB10::10::INSTR')
-    lockin_right = SR830_T10('lockin_r', 'GPIB10::14::INSTR')
-    zi = ZIUHFLI('ziuhfli', 'dev2189')
-    v1 = vna.ZNB20('VNA', 'TCPIP0::192.168.15.108::inst0::INSTR')
-    sg1 = sg.RohdeSchwarz_SGS100A("sg1",
-                                  "TCPIP0::192.168.15.107::inst0::INSTR")
-    keysightgen_left = Keysight_33500B('keysight_gen_left',
-                                       'TCPIP0::192.168.15.101::inst0::INSTR')
-    keysightgen_mid = Keysight_33500B('keysight_gen_mid',
-                                      'TCPIP0::192.168.15.114::inst0::INSTR')
-    keysightgen_right = Keysight_33500B('keysight_gen_right',
-                                        'TCPIP0::192.168.15.109::inst0::INSTR')
-
-    keysightdmm_top = Keysight_34465A_T10('keysight_dmm_top',
-                                          'TCPIP0::192.168.15.111::inst0::INSTR')
-    keysightdmm_mid = Keysight_34465A_T10('keysight_dmm_mid',
-                                          'TCPIP0::192.168.15.112::inst0::INSTR')
-    keysightdmm_bot = Keysight_34465A_T10('keysight_dmm_bot',
-                                          'TCPIP0::192.168.15.113::inst0::INSTR')
-
-    # keithleytop=keith.Keithley_2600('keithley_top',
-    # 'TCPIP0::192.168.15.116::inst0::INSTR',"a,b")
-    keithleybot_a = keith.Keithley_2600('keithley_bot',
-                                        'TCPIP0::192.168.15.115::inst0::INSTR',"a")
-
-    mercury = MercuryiPS(name='mercury',
-                         address='192.168.15.102',
-                         port=7020,
-                         axes=['X', 'Y', 'Z'])
-
-    hpsg1 = hpsg.HP8133A("hpsg1", 'GPIB10::4::INSTR')
-    awg1 = awg.Tektronix_AWG5014('AWG1',
-                                 'TCPIP0::192.168.15.105::inst0::INSTR',
-                                 timeout=40)
-    awg2 = awg.Tektronix_AWG5014('AWG2',
-                                 'TCPIP0::192.168.15.106::inst0::INSTR',
-                                 timeout=180)
-
-    print('Querying all instrument parameters for metadata.'
-          'This may take a while...')
-
-
-    STATION = qc.Station(qdac, lockin_topo, lockin_right, lockin_left,
-                         keysightgen_left, keysightgen_mid, keysightgen_right,
-                         keysightdmm_top, keysightdmm_mid, keysightdmm_bot,
-                         awg1, awg2, sg1, zi,
-                         keithleybot_a, mercury, hpsg1)
+    # The instruments are described in station.config and connected on
+    # first access, e.g. STATION['qdac']
+    STATION = LazyStation(
+        r'A:\qcodes_experiments\modules\Majorana\station.config')
+
+    # The instruments under their usual names, for the scripts run with
+    # %run -i. Each connects on first use.
+    qdac = LazyInstrument(STATION, 'qdac')
+    lockin_topo = LazyInstrument(STATION, 'lockin_topo')
+    lockin_left = LazyInstrument(STATION, 'lockin_l')
+    lockin_right = LazyInstrument(STATION, 'lockin_r')
+    zi = LazyInstrument(STATION, 'ziuhfli')
+    v1 = LazyInstrument(STATION, 'VNA')
+    sg1 = LazyInstrument(STATION, 'sg1')
+    keysightgen_left = LazyInstrument(STATION, 'keysight_gen_left')
+    keysightgen_mid = LazyInstrument(STATION, 'keysight_gen_mid')
+    keysightgen_right = LazyInstrument(STATION, 'keysight_gen_right')
+    keysightdmm_top = LazyInstrument(STATION, 'keysight_dmm_top')
+    keysightdmm_mid = LazyInstrument(STATION, 'keysight_dmm_mid')
+    keysightdmm_bot = LazyInstrument(STATION, 'keysight_dmm_bot')
+    keithleybot_a = LazyInstrument(STATION, 'keithley_bot')
+    mercury = LazyInstrument(STATION, 'mercury')
+    hpsg1 = LazyInstrument(STATION, 'hpsg1')
+    awg1 = LazyInstrument(STATION, 'AWG1')
+    awg2 = LazyInstrument(STATION, 'AWG2')
 
     # Initialisation of the experiment
 
@@ -2,13 +2,11 @@ import numpy as np
 from datetime import datetime
 from inspect import signature
 
-import broadbean as bb
 from qcodes.instrument.parameter import ArrayParameter, StandardParameter
 from qcodes.utils.helpers import full_class
 from qcodes.utils.wrappers import do1d
 
-ramp = bb.PulseAtoms.ramp
-sine = bb.PulseAtoms.sine
+from modules.Majorana.zi_timing import closest_samplingrate
 
 
 class ArgumentError(Exception):
@@ -294,27 +292,7 @@ def _DPE_correct_meastime(meastime, npts):
     """
 
     # TODO: is a logarithmic error measure better than a linear one?
-
-    # the sample rates of the lock-in
-    SRs = [1.8e9/2**n for n in range(17)]
-
-    realtimes = np.array([npts/SR for SR in SRs])
-    errors = np.abs(meastime-realtimes)
-
-    newtime = realtimes[errors.argmin()]
-
-    SRstrings = ['1.80 GHz', '900 MHz', '450 MHz', '225 MHz', '113 MHz',
-                 '56.2 MHz',
-                 '28.1 MHz', '14.0 MHz', '7.03 MHz', '3.50 MHz', '1.75 MHz',
-                 '880 kHz',
-                 '440 kHz', '220 kHz', '110 kHz', '54.9 kHz', '27.5 kHz']
-
-    SRstring = SRstrings[errors.argmin()]
-
-    # Do some rounding for safety
-    newtime = float('{:.4e}'.format(newtime))
-
-    return newtime, SRstring
+    return closest_samplingrate(meastime, npts)
 
 
 def _DPE_makeSequence(hightime, trig_delay, meastime, prewaittime, cycletime,
@@ -342,6 +320,10 @@ def _DPE_makeSequence(hightime, trig_delay, meastime, prewaittime, cycletime,
             by broadbean.
     """
 
+    # imported here, since broadbean is slow to import
+    import broadbean as bb
+    ramp = bb.PulseAtoms.ramp
+
     waitbits = 100  # no. of repetitions of the first part
     waitbittime = prewaittime/waitbits
     trig_duration = 5e-6
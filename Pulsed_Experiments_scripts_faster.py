@@ -1,15 +1,32 @@
+import copy
+import itertools
+import queue
+import threading
+import time
 import numpy as np
 from datetime import datetime
+from functools import lru_cache
 from inspect import signature
 
-import broadbean as bb
 import qcodes as qc
 from qcodes.instrument.parameter import ArrayParameter, StandardParameter
 from qcodes.utils.helpers import full_class
+from qcodes.utils.validators import Numbers
 from qcodes.utils.wrappers import do1d
 
-ramp = bb.PulseAtoms.ramp
-sine = bb.PulseAtoms.sine
+from modules.Majorana.adaptive_averaging import RunningStats
+from modules.Majorana.awg_rendering import render_sequence
+from modules.Majorana.instrument_config import (apply_settings,
+                                                invalidate_settings)
+from modules.Majorana.keysight_ramps import FastRamp
+from modules.Majorana.pulsed_spec import PulsedExperimentSpec
+from modules.Majorana.sequence_preview import preview_sequence
+
+# Tektronix AWG5014 sequencer and channel limits
+AWG_MAX_REPETITIONS = 65536
+AWG_MIN_ELEMENT_POINTS = 250
+AWG_MIN_AMPLITUDE = 0.02  # Vpp
+AWG_MAX_AMPLITUDE = 4.5  # Vpp
 
 
 class ArgumentError(Exception):
@@ -22,18 +39,19 @@ class ArgumentError(Exception):
 def check_kwargs(func):
     """
     Decorator function that ensures that all kwargs of a function taking
-    only kwargs have been specified.
+    only kwargs have been specified. Keyword-only arguments (after a *)
+    are optional.
     """
 
     params = signature(func).parameters
-    no_of_args = len(params)
+    needed = set(name for name, param in params.items()
+                 if param.kind != param.KEYWORD_ONLY)
 
     def wrapper(**kwargs):
 
         given = set(kwargs.keys())
-        needed = set(params.keys())
 
-        if len(kwargs) < no_of_args:
+        if not needed.issubset(given):
             missing = needed.difference(given)
             raise ArgumentError('Unspecified arguments: {}'.format(missing))
 
@@ -52,7 +70,8 @@ class AverageRampResponse(ArrayParameter):
 
     def __init__(self, name, awg, zi, no_of_avgs, voltages,
                  awg_channel=1,
-                 label=None, unit=None):
+                 label=None, unit=None, pipelined=False,
+                 stop_criterion=None):
         """
         Instantiate the parameter. The setpoints must be known at
         the time of instantiation and can not be changed.
@@ -66,6 +85,16 @@ class AverageRampResponse(ArrayParameter):
             awg_channel (int): The relevant AWG channel. Each .awg file
                 upload switches the channels off, so we must know this
                 to switch them back on.
+            pipelined (bool): If True, the AWG keeps running and each
+                repetition is started by an event jump, while the scope
+                runs continuously (re-arming itself after each record) and
+                a background thread pulls the records from the scope
+                module. Requires a sequence ending in an event-jump element
+                (as made by _DPE_makeSequence with event_jump=True and by
+                _DPE_makeFullSequence). Default: False.
+            stop_criterion (Optional[StopCriterion]): If given, stop
+                averaging as soon as it is met. no_of_avgs is then the
+                maximal number of repetitions.
         """
 
         super().__init__(name, shape=(len(voltages),))
@@ -75,6 +104,10 @@ class AverageRampResponse(ArrayParameter):
         self.awgchannel = awg_channel
 
         self.no_of_avgs = no_of_avgs
+        self.pipelined = pipelined
+        self.stop_criterion = stop_criterion
+        self.last_stats = None
+        self._scope_module = None
 
         self.setpoints = (tuple(voltages),)
         self.setpoint_labels = ('Ramp voltage',)
@@ -88,9 +121,99 @@ class AverageRampResponse(ArrayParameter):
         # instrument, so we fake one
         # self._instrument = FakeInstrument('Ramp machine')
 
+    def _scope(self):
+        """
+        The scope module of the data server used by the pipelined get.
+        Made once and kept subscribed to the scope wave.
+        """
+        if self._scope_module is None:
+            scope = self.zi.daq.scopeModule()
+            scope.set('scopeModule/mode', 1)  # time domain
+            scope.set('scopeModule/averager/weight', 1)  # no averaging
+            scope.set('scopeModule/historylength', 1)
+            scope.subscribe('/{}/scopes/0/wave'.format(self.zi.device))
+            self._scope_module = scope
+        return self._scope_module
+
+    def _acquire_frames(self, frames, stop, timeout=10):
+        """
+        Worker for the pipelined get. As soon as the scope module holds the
+        record of a repetition, the next repetition is started with an
+        event and the record is handed over to the main thread while the
+        AWG plays on. The transfer time at the start of each repetition
+        lets the scope re-arm in time.
+        """
+        scope = self._scope()
+        scopenode = '/{}/scopes/0/'.format(self.zi.device)
+        segments = int(self.zi.scope_segments_count.get_latest())
+        records = scope.getInt('scopeModule/records')
+        try:
+            for n in range(self.no_of_avgs):
+                t_start = time.time()
+                while scope.getInt('scopeModule/records') <= records + n:
+                    if stop.is_set():
+                        return
+                    if time.time() - t_start > timeout:
+                        raise RuntimeError('Timeout while waiting for scope '
+                                           'record {}'.format(n))
+                    time.sleep(0.001)
+                result = scope.read(True)
+                if n + 1 < self.no_of_avgs and not stop.is_set():
+                    self.awg.force_event()
+                wave = np.asarray(result[scopenode + 'wave'][-1][0]['wave'])
+                frames.put(wave.reshape(len(wave), segments, -1))
+        except Exception as e:
+            frames.put(e)
+
+    def _get_pipelined(self, stats):
+        zi = self.zi
+        scopenode = '/{}/scopes/0/'.format(zi.device)
+        scope = self._scope()
+
+        frames = queue.Queue(maxsize=2)
+        stop = threading.Event()
+        worker = threading.Thread(target=self._acquire_frames,
+                                  args=(frames, stop), daemon=True)
+
+        # let the scope trigger continuously, re-arming after each record
+        zi.daq.setInt(scopenode + 'single', 0)
+        zi.daq.setInt(scopenode + 'enable', 1)
+        zi.daq.sync()
+        scope.execute()
+
+        self.awg.run()
+        worker.start()
+        try:
+            for n in range(self.no_of_avgs):
+                temp_data = frames.get()
+                if isinstance(temp_data, Exception):
+                    raise temp_data
+                # averaging overlaps with the next acquisition
+                stats.add(np.mean(temp_data[1], axis=1))
+                if self._done(stats):
+                    break
+        finally:
+            stop.set()
+            # unblock the worker if it is waiting to hand over a frame
+            while worker.is_alive():
+                try:
+                    frames.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            self.awg.stop()
+            scope.finish()
+            zi.daq.setInt(scopenode + 'enable', 0)
+            zi.daq.setInt(scopenode + 'single', 1)
+            zi.daq.sync()
+
+    def _done(self, stats):
+        return (self.stop_criterion is not None and
+                self.stop_criterion.done(stats))
+
     def get(self):
         """
-        The get call. Performs the measurement no_of_avgs times
+        The get call. Performs the measurement no_of_avgs times, or fewer
+        if a stop_criterion is set and met earlier.
         """
         # we expect two scope subscriptions
         # and the relevant one must be on Channel 2
@@ -98,21 +221,27 @@ class AverageRampResponse(ArrayParameter):
 
         self.zi.Scope.prepare_scope()
 
-        data = np.zeros(self.zi.scope_segments_count())
+        stats = RunningStats()
+        if self.stop_criterion is not None:
+            self.stop_criterion.start()
 
         # switch AWG channel on (an .awg file upload will have switched it off)
         self.awg.parameters['ch{}_state'.format(self.awgchannel)].set(1)
 
-        for n in range(self.no_of_avgs):
-            self.awg.run()
-            temp_data = self.zi.Scope.get()
-            self.awg.stop()
-            demod_data_avg = [np.mean(arr) for arr in temp_data[1]]
-            data += np.array(demod_data_avg)
+        if self.pipelined:
+            self._get_pipelined(stats)
+        else:
+            for n in range(self.no_of_avgs):
+                self.awg.run()
+                temp_data = self.zi.Scope.get()
+                self.awg.stop()
+                stats.add(np.mean(temp_data[1], axis=1))
+                if self._done(stats):
+                    break
 
-        data /= self.no_of_avgs
+        self.last_stats = stats
 
-        return data
+        return stats.mean
 
 
 # TODO: rewrite this set method using the new FULL sequence
@@ -155,9 +284,10 @@ class PulseTime(StandardParameter):
         self.seq.element(self.pos).changeDuration(self.chan,
                                                   self.segname, width)
 
-        package = self.seq.outputForAWGFile()
+        package = render_sequence(self.seq)
         self.awg.make_send_and_load_awg_file(*package[:],
                                              channels=self.awgchannels)
+        invalidate_settings(self.awg)
 
     def get(self):
         return 1
@@ -188,30 +318,82 @@ class PulseTime(StandardParameter):
         return state
 
 
+class PulseAmplitude(StandardParameter):
+    """
+    The parameter setting a new pulse amplitude.
+
+    The sequence is normalised to the AWG channel range, so scaling the
+    channel amplitude scales the pulse (the zero level stays at zero since
+    the channel offset is zero). No file is re-uploaded.
+    """
+
+    def __init__(self, name, awg, awg_channel, basesequence):
+        """
+        Args:
+            name (str): The name of the parameter.
+            awg (Tektronix_AWG5014): An instance of the QCoDeS instrument
+            awg_channel (int): The AWG channel playing the pulse
+            basesequence (Sequence): broadbean Sequence object (already
+                uploaded). Only used for the metadata.
+        """
+        super().__init__(name, set_cmd=self.set, get_cmd=self.get,
+                         vals=Numbers(AWG_MIN_AMPLITUDE/2,
+                                      AWG_MAX_AMPLITUDE/2))
+
+        self.unit = 'V'
+        self.label = 'Pulse amplitude'
+        self.awg = awg
+        self.awgchannel = awg_channel
+        self.seq = basesequence
+
+    def _amp_param(self):
+        return self.awg.parameters['ch{}_amp'.format(self.awgchannel)]
+
+    def set(self, amplitude):
+        # The channel amplitude is peak-to-peak
+        self._amp_param().set(2*amplitude)
+
+    def get(self):
+        return self._amp_param().get()/2
+
+    def snapshot_base(self, update=False):
+        """
+        State of the pulse amplitude parameter as a JSON-compatible dict.
+        Records the entire pulse sequence in the metadata.
+
+        Args:
+            update (bool): Not used.
+
+        Returns:
+            dict: base snapshot
+        """
+
+        state = super().snapshot_base(update=update)
+
+        state['pulse_sequence'] = self.seq.description
+
+        return state
+
+
 def _DPE_prepareKeysight(no_of_pulses=None, cycletime=None, ramp_low=None,
-                         ramp_high=None, keysight=None):
+                         ramp_high=None, keysight=None, keysight_channel=1):
     """
     Prepare the Keysight
     """
     if None in [no_of_pulses, cycletime, ramp_low, ramp_high, keysight]:
         raise ValueError('Keysight settings underspecified!')
 
-    keysight.ch1_function_type('RAMP')
-    keysight.ch1_ramp_symmetry(100)
+    fast_ramp = FastRamp(keysight, keysight_channel)
 
     period = no_of_pulses*cycletime
-    keysight.ch1_frequency(1/period)  # plus some trigger dead time?
-    keysight.ch1_amplitude(ramp_high-ramp_low)
-    keysight.ch1_offset(ramp_low)
-
-    keysight.ch1_trigger_source('EXT')
-    keysight.ch1_trigger_delay(0)
-    keysight.ch1_trigger_slope('POS')
 
-    keysight.ch1_burst_mode('N Cycle')
-    keysight.ch1_burst_ncycles(1)
-    keysight.ch1_burst_phase(180)
-    keysight.ch1_burst_state('ON')
+    # plus some trigger dead time on the frequency?
+    settings = fast_ramp.settings(amplitude=ramp_high-ramp_low,
+                                  offset=ramp_low,
+                                  frequency=1/period,
+                                  symmetry=100)
+    settings.update(fast_ramp.burst_settings(ncycles=1, phase=180))
+    apply_settings(keysight, settings)
 
 
 def _DPE_prepareTektronixAWG(awg, awg_channel, SR, pulsehigh):
@@ -228,107 +410,97 @@ def _DPE_prepareTektronixAWG(awg, awg_channel, SR, pulsehigh):
     # NB: If you change these settings, make sure to change them in
     # _DPE_makeSequence as well!
 
-    awg.clock_freq(SR)
-    awg.parameters['ch{}_amp'.format(awg_channel)].set(2*pulsehigh)
-    awg.parameters['ch{}_offset'.format(awg_channel)].set(0)
+    apply_settings(awg, {'clock_freq': SR,
+                         'ch{}_amp'.format(awg_channel): 2*pulsehigh,
+                         'ch{}_offset'.format(awg_channel): 0,
+                         'ch{}_add_input'.format(awg_channel): '"ESIG"'})
+    # an .awg file upload switches the channel off behind our back,
+    # so the state is always written
     awg.parameters['ch{}_state'.format(awg_channel)].set(1)
-    awg.parameters['ch{}_add_input'.format(awg_channel)].set('"ESIG"')
 
 
-def _DPE_prepareZIUHFLI(zi, demod_freq, pts_per_shot,
-                        SRstring, no_of_pulses, meastime):
+def _DPE_prepareZIUHFLI(zi, demod_freq, timing):
     """
     Prepare the ZI UHF-LI
 
     Args:
         zi (ZIUHFLI): QCoDeS instrument instance
         demod_freq (float): The demodulation frequency (Hz)
-        pts_per_shot (int): No. of points per measurement. Most likely 4096.
-        SRstring (str): The string version of the sample rate used by the
-            lock-in, e.g. '113 MHz'. Should be the output of
-            _DPE_correct_meastime.
-        no_of_pulses (int): No. of pulses riding on the ramp, i.e. number
-            of scope segments.
-        meastime (float): The data acquisition time per point (s)
-    """
-
-    # Demodulator
-    zi.oscillator1_freq(demod_freq)
-    zi.demod1_order(1)
-    zi.demod1_timeconstant(0.1*meastime)
-    zi.signal_output1_on('ON')
-    # TODO: use this in post-processing to remove first part of demod. data
-
-    # Scope
-    zi.scope_channel1_input('Demod 1 R')
-    zi.scope_channel2_input('Signal Input 2')
-    zi.scope_mode('Time Domain')
-    zi.scope_samplingrate(SRstring)
-    zi.scope_length(pts_per_shot)
-    zi.scope_channels(3)
-    #
-    zi.scope_trig_enable('ON')
-    # trigger delay reference point: at trigger event time
-    zi.scope_trig_reference(0)
-    zi.scope_trig_delay(1e-6)
-    zi.scope_trig_holdoffmode('s')
-    zi.scope_trig_holdoffseconds(60e-6)
-    zi.scope_trig_gating_enable('OFF')
-    zi.scope_trig_signal('Trig Input 1')
-    #
-    zi.scope_segments('ON')
-    zi.scope_segments_count(no_of_pulses)
-
-
-def _DPE_correct_meastime(meastime, npts):
-    """
-    Given a number of points to measure, and a desired measurement time,
-    find the measurement time closest to the given one that the ZI UHF-LI can
-    actually realise.
-
-    Args:
-        meastime (float): The desired measurement time
-        npts (int): The desired number of points
-
-    Returns:
-        tuple (float, str): A tuple with the new measurement time and
-            a string with the sample rate achieving this
+        timing (FastTiming): The scope timing, one segment per pulse
+            riding on the ramp (see PulsedExperimentSpec.timing)
     """
 
-    # TODO: is a logarithmic error measure better than a linear one?
-
-    # the sample rates of the lock-in
-    SRs = [1.8e9/2**n for n in range(17)]
+    # scope_mode is a scope module setting, not a device node
+    zi.scope_mode('Time Domain')
 
-    realtimes = np.array([npts/SR for SR in SRs])
-    errors = np.abs(meastime-realtimes)
+    apply_settings(zi, {  # Demodulator
+                        'oscillator1_freq': demod_freq,
+                        'demod1_order': 1,
+                        'demod1_timeconstant': 0.1*timing.scope_duration,
+                        'signal_output1_on': 'ON',
+                        # TODO: use this in post-processing to remove
+                        # first part of demod. data
+                        # Scope
+                        'scope_channel1_input': 'Demod 1 R',
+                        'scope_channel2_input': 'Signal Input 2',
+                        'scope_samplingrate': timing.SRstring,
+                        'scope_length': timing.scope_length,
+                        'scope_channels': 3,
+                        #
+                        'scope_trig_enable': 'ON',
+                        # trigger delay reference point: at trigger
+                        # event time
+                        'scope_trig_reference': 0,
+                        'scope_trig_delay': timing.trigger_delay,
+                        'scope_trig_holdoffmode': 's',
+                        'scope_trig_holdoffseconds': timing.trigger_holdoff,
+                        'scope_trig_gating_enable': 'OFF',
+                        'scope_trig_signal': 'Trig Input 1',
+                        #
+                        'scope_segments': 'ON',
+                        'scope_segments_count': timing.segments})
+
+
+def _DPE_constantChunks(duration, SR, chunk_points=2500):
+    """
+    Split a long constant stretch into a short element and a repetition
+    count for the AWG sequencer, so that the uploaded waveform scales with
+    the number of edges rather than with the duration.
 
-    newtime = realtimes[errors.argmin()]
+    The stretch is rounded up to a whole number of chunks.
 
-    SRstrings = ['1.80 GHz', '900 MHz', '450 MHz', '225 MHz', '113 MHz',
-                 '56.2 MHz',
-                 '28.1 MHz', '14.0 MHz', '7.03 MHz', '3.50 MHz', '1.75 MHz',
-                 '880 kHz',
-                 '440 kHz', '220 kHz', '110 kHz', '54.9 kHz', '27.5 kHz']
+    Args:
+        duration (float): The duration of the constant stretch (s)
+        SR (int): The AWG sample rate (Sa/s)
+        chunk_points (int): The preferred length of the element (points).
+            Grown if the repetition count would exceed what the AWG can do.
 
-    SRstring = SRstrings[errors.argmin()]
+    Returns:
+        tuple (float, int): The duration of the element and the number of
+            repetitions
+    """
+    chunk_points = max(chunk_points, AWG_MIN_ELEMENT_POINTS)
+    total_points = int(np.ceil(duration*SR))
 
-    # Do some rounding for safety
-    newtime = float('{:.4e}'.format(newtime))
+    nreps = max(1, int(np.ceil(total_points/chunk_points)))
+    if nreps > AWG_MAX_REPETITIONS:
+        chunk_points = int(np.ceil(total_points/AWG_MAX_REPETITIONS))
+        nreps = int(np.ceil(total_points/chunk_points))
 
-    return newtime, SRstring
+    return chunk_points/SR, nreps
 
 
 def _DPE_makeFullSequence(hightimes, trig_delay, meastime, prewaittime,
                           cycletime, no_of_avgs,
-                          no_of_pulses, pulsehigh, SR, segname):
+                          no_of_pulses, pulsehigh, SR, segname,
+                          variations=None):
     """
     Generate the full sequence (to be uploaded exactly once).
 
     The sequence is a varied sequence with a baseelement consisting
     of four parts:
     1: A wait with zeros allowing the ZI to get ready. This part is
-    short, but repeated waitbits times
+    short, but repeated waitbits times (see _DPE_constantChunks)
     2: A short zero part with the marker2 trigger for the ramp
     3: The high pulse and a marker1 trigger for the ZI
     4: A short zero part with an event jump leading back to part one.
@@ -346,14 +518,29 @@ def _DPE_makeFullSequence(hightimes, trig_delay, meastime, prewaittime,
         SR (int): The AWG sample rate (Sa/s)
         segname (str): The name of the high pulse segment as used internally
             by broadbean.
+        variations (Optional[list]): What to vary across the blocks, as a
+            list of (segment name, argument, values), all values lists of
+            equal length. Defaults to varying the duration of the high
+            pulse through hightimes. A sequence with explicit variations
+            is a jump table (see PulseTable): its router does not wait for
+            a trigger.
     """
 
-    waitbits = 100  # no. of repetitions of the first part
-    waitbittime = prewaittime/waitbits
-    trig_duration = 5e-6
+    # imported here, since broadbean is slow to import
+    import broadbean as bb
+    ramp = bb.PulseAtoms.ramp
+
+    # In a jump table nothing sends the router a trigger; it passes
+    # straight on to the block selected by its goto index
+    router_wait = 1
+    if variations is None:
+        variations = [(segname, 'duration', hightimes)]
+    else:
+        router_wait = 0
 
-    if waitbittime < 10/SR:
-        raise ValueError('prewaittime too short.')
+    # the first part is a short element repeated waitbits times
+    waitbittime, waitbits = _DPE_constantChunks(prewaittime, SR)
+    trig_duration = 5e-6
 
     # The pulsed part
     bp_pulse = bb.BluePrint()
@@ -389,7 +576,7 @@ def _DPE_makeFullSequence(hightimes, trig_delay, meastime, prewaittime,
 
     routerseq = bb.Sequence()
     routerseq.addElement(1, routerelem)
-    routerseq.setSequenceSettings(1, 1, 1, 0, 0)  # overridden below
+    routerseq.setSequenceSettings(1, router_wait, 1, 0, 0)  # overridden below
     routerseq.setSR(SR)
     routerseq.setChannelVoltageRange(1, 2*pulsehigh, 0)
 
@@ -425,11 +612,11 @@ def _DPE_makeFullSequence(hightimes, trig_delay, meastime, prewaittime,
     baseseq.setChannelVoltageRange(1, 2*pulsehigh, 0)
 
     # Now make the variation
-    poss = [3]
-    channels = [1]
-    names = [segname]
-    args = ['duration']
-    iters = [hightimes]
+    poss = [3]*len(variations)
+    channels = [1]*len(variations)
+    names = [var[0] for var in variations]
+    args = [var[1] for var in variations]
+    iters = [list(var[2]) for var in variations]
 
     # might as well have a bit of auto-debug...
     baseseq.checkConsistency(verbose=True)
@@ -440,25 +627,217 @@ def _DPE_makeFullSequence(hightimes, trig_delay, meastime, prewaittime,
     fullseq = routerseq + longseq
 
     # Now set all event jumps to point back to the first (routing) element
-    for ii in range(len(hightimes)):
+    for ii in range(len(iters[0])):
         fullseq.setSequenceSettings(1+(ii+1)*4, 0, 0, 1, 0)
     # And set the routing element to route correctly for the first iteration
-    fullseq.setSequenceSettings(1, 1, 1, 0, 2)
+    fullseq.setSequenceSettings(1, router_wait, 1, 0, 2)
 
     return fullseq
 
 
+# The pulse parameters that can be swept in a single upload, and the
+# (segment name, argument) pairs of the pulse segment they vary
+_DPE_SWEEPABLE = {'hightime': [('high', 'duration')],
+                  'amplitude': [('high', 'start'), ('high', 'stop')]}
+
+
+class PulseTable:
+    """
+    The jump table of a full sequence holding the Cartesian product of
+    several pulse parameters. Selecting a block means pointing the goto of
+    the routing element (position 1) at it.
+    """
+
+    def __init__(self, awg, sweeps):
+        """
+        Args:
+            awg (Tektronix_AWG5014): An instance of the QCoDeS instrument
+            sweeps (list): A list of (name, values) of the swept pulse
+                parameters, outermost first.
+        """
+        self.awg = awg
+        self.names = [name for name, _ in sweeps]
+        self.shape = tuple(len(values) for _, values in sweeps)
+        self.indices = [0]*len(sweeps)
+
+    def variations(self, sweeps):
+        """
+        The flattened Cartesian product as (segment name, argument, values)
+        for _DPE_makeFullSequence
+        """
+        product = list(itertools.product(*[values for _, values in sweeps]))
+        variations = []
+        for ii, (name, _) in enumerate(sweeps):
+            for segname, arg in _DPE_SWEEPABLE[name]:
+                variations.append((segname, arg,
+                                   [point[ii] for point in product]))
+        return variations
+
+    def select(self, axis, index):
+        """
+        Set the index of one axis and route the AWG to the resulting block
+        """
+        self.indices[axis] = index
+        block = int(np.ravel_multi_index(self.indices, self.shape))
+        # the router is position 1, each block has four positions
+        target = 2 + 4*block
+        self.awg.write('SEQuence:ELEMent1:GOTO:INDex {}'.format(target))
+
+
+class PulseTableAxis(StandardParameter):
+    """
+    One axis of a PulseTable. Setting it only re-routes the AWG.
+    """
+
+    def __init__(self, name, table, axis, values, label=None, unit=None):
+        """
+        Args:
+            name (str): The name of the parameter.
+            table (PulseTable): The table this is an axis of
+            axis (int): The index of the axis in the table
+            values (list): The values of this axis in the uploaded sequence
+        """
+        super().__init__(name, set_cmd=self.set, get_cmd=self.get)
+
+        self.table = table
+        self.axis = axis
+        self.values = np.array(values)
+        self.label = label or name
+        self.unit = unit or ''
+
+    def set(self, value):
+        index = int(np.abs(self.values-value).argmin())
+        self.table.select(self.axis, index)
+
+    def get(self):
+        return self.values[self.table.indices[self.axis]]
+
+
+def doPulsedSweep(sweeps, fast_start, fast_stop, fast_npts, n_avgs,
+                  pts_per_shot, hightime, meastime, cycletime, transfertime,
+                  pulsehigh, trig_delay, demod_freq, awg_channel, awg, ZI,
+                  keysight, stop_criterion=None, pipelined=False):
+    """
+    Pulsed experiment sweeping several pulse parameters with a single AWG
+    upload. The Cartesian product of all values is built into one jump
+    table sequence and the loops only re-route the AWG between blocks.
+
+    Args:
+        sweeps (list): A list of (name, values), outermost first. The
+            names must be in _DPE_SWEEPABLE ('hightime', 'amplitude').
+        (the remaining arguments are as for doPulsedExperiment. hightime
+        and pulsehigh are the values used for non-swept parameters)
+        stop_criterion (Optional[StopCriterion]): Adaptive averaging, with
+            n_avgs as the maximum
+        pipelined (bool): See AverageRampResponse
+
+    Returns:
+        DataSet: The N+1 dimensional dataset
+    """
+    for name, _ in sweeps:
+        if name not in _DPE_SWEEPABLE:
+            raise NotImplementedError('Can not sweep {}. Sweepable pulse '
+                                      'parameters are: '
+                                      '{}.'.format(name,
+                                                   list(_DPE_SWEEPABLE)))
+
+    # the channel range must accommodate the given and all swept amplitudes
+    # and each cycle the longest swept pulse
+    hightimes = [hightime]
+    for name, values in sweeps:
+        if name == 'amplitude':
+            pulsehigh = max([abs(pulsehigh)] + list(np.abs(values)))
+        elif name == 'hightime':
+            hightimes += list(values)
+    if 2*pulsehigh > AWG_MAX_AMPLITUDE:
+        raise ValueError('Pulse amplitude too high. Must be at most '
+                         '{} V.'.format(AWG_MAX_AMPLITUDE/2))
+
+    # the spec checks the timing for the shortest and longest pulse
+    spec = PulsedExperimentSpec(fast_axis='ramp', slow_axis='dt',
+                                slow_start=min(hightimes),
+                                slow_stop=max(hightimes),
+                                slow_npts=2, fast_start=fast_start,
+                                fast_stop=fast_stop, fast_npts=fast_npts,
+                                n_avgs=n_avgs, pts_per_shot=pts_per_shot,
+                                hightime=hightime, meastime=meastime,
+                                cycletime=cycletime,
+                                transfertime=transfertime,
+                                pulsehigh=pulsehigh, trig_delay=trig_delay,
+                                demod_freq=demod_freq,
+                                awg_channel=awg_channel)
+
+    SR = spec.SR
+
+    timing = spec.timing()
+    meastime = timing.scope_duration
+
+    _DPE_prepareKeysight(no_of_pulses=fast_npts, cycletime=cycletime,
+                         ramp_low=fast_start, ramp_high=fast_stop,
+                         keysight=keysight)
+    _DPE_prepareTektronixAWG(awg=awg, awg_channel=awg_channel, SR=SR,
+                             pulsehigh=pulsehigh)
+    _DPE_prepareZIUHFLI(zi=ZI, demod_freq=demod_freq, timing=timing)
+
+    table = PulseTable(awg, sweeps)
+
+    fullseq = _DPE_makeFullSequence(hightimes=[hightime],
+                                    trig_delay=trig_delay,
+                                    meastime=meastime,
+                                    prewaittime=transfertime,
+                                    cycletime=cycletime,
+                                    no_of_avgs=n_avgs,
+                                    no_of_pulses=fast_npts,
+                                    pulsehigh=pulsehigh,
+                                    SR=SR, segname='high',
+                                    variations=table.variations(sweeps))
+
+    package = render_sequence(fullseq)
+    awg.make_send_and_load_awg_file(*package[:], channels=[awg_channel])
+    invalidate_settings(awg)
+
+    units = {'hightime': 's', 'amplitude': 'V'}
+    axes = [PulseTableAxis(name, table, ii, values, unit=units[name])
+            for ii, (name, values) in enumerate(sweeps)]
+
+    voltages = np.linspace(fast_start, fast_stop, fast_npts)
+    ramp_avg = AverageRampResponse(name='ramp_response', awg=awg, zi=ZI,
+                                   no_of_avgs=n_avgs, voltages=voltages,
+                                   awg_channel=awg_channel,
+                                   label='Demod response', unit=None,
+                                   pipelined=pipelined,
+                                   stop_criterion=stop_criterion)
+
+    for axis in axes:
+        awg.parameters[axis.name] = axis
+        axis._instrument = awg
+    awg.parameters['ramp_avg'] = ramp_avg
+    ramp_avg._instrument = awg
+
+    loop = qc.Loop(axes[-1][list(sweeps[-1][1])], 0).each(ramp_avg)
+    for axis, (_, values) in zip(axes[-2::-1], sweeps[-2::-1]):
+        loop = qc.Loop(axis[list(values)], 0).each(loop)
+
+    data = loop.get_data_set(name='pulsed_sweep')
+    loop.run()
+
+    return data
+
+
 def _DPE_makeSequence(hightime, trig_delay, meastime, prewaittime,
                       cycletime,
-                      no_of_pulses, pulsehigh, SR, segname):
+                      no_of_pulses, pulsehigh, SR, segname,
+                      event_jump=False):
     """
     Generate the pulse sequence for the experiment.
 
     The sequence consists of three parts:
     1: A wait with zeros allowing the ZI to get ready. This part is
-    short, but repeated waitbits times
+    short, but repeated waitbits times (see _DPE_constantChunks)
     2: A short zero part with the marker2 trigger for the ramp
     3: The high pulse and a marker1 trigger for the ZI
+    and, if event_jump is True, a fourth:
+    4: A short zero part with an event jump leading back to part one.
 
     Args:
         hightime (float): The width of the pulse (s)p
@@ -472,14 +851,18 @@ def _DPE_makeSequence(hightime, trig_delay, meastime, prewaittime,
         SR (int): The AWG sample rate (Sa/s)
         segname (str): The name of the high pulse segment as used internally
             by broadbean.
+        event_jump (bool): Whether to end with the event-jump element, as
+            needed by the pipelined AverageRampResponse. Without it the
+            sequence plays once and finishes. Default: False.
     """
 
-    waitbits = 100  # no. of repetitions of the first part
-    waitbittime = prewaittime/waitbits
-    trig_duration = 5e-6
+    # imported here, since broadbean is slow to import
+    import broadbean as bb
+    ramp = bb.PulseAtoms.ramp
 
-    if waitbittime < 10/SR:
-        raise ValueError('prewaittime too short.')
+    # the first part is a short element repeated waitbits times
+    waitbittime, waitbits = _DPE_constantChunks(prewaittime, SR)
+    trig_duration = 5e-6
 
     # The pulsed part
     bp1 = bb.BluePrint()
@@ -520,12 +903,50 @@ def _DPE_makeSequence(hightime, trig_delay, meastime, prewaittime,
 
     seq.setSequenceSettings(1, 0, waitbits, 0, 2)
     seq.setSequenceSettings(2, 0, 1, 0, 3)
-    # the last zero disables jumping, i.e. seq. plays once
     seq.setSequenceSettings(3, 0, no_of_pulses, 0, 0)
 
+    if event_jump:
+        bp_return = bb.BluePrint()
+        bp_return.insertSegment(0, 'waituntil', 10/SR)
+        bp_return.setSR(SR)
+
+        returnelem = bb.Element()
+        returnelem.addBluePrint(1, bp_return)
+
+        seq.addElement(4, returnelem)
+        # the sequence plays once and then idles here until an event
+        # sends it back to the top (see AverageRampResponse)
+        seq.setSequenceSettings(4, 0, 0, 1, 0)
+
     return seq
 
 
+@lru_cache(maxsize=32)
+def _DPE_specSequence(spec, event_jump=False):
+    """
+    The base sequence of a pulsed experiment spec. Memoized, so callers
+    that modify the sequence must work on a copy (see _DPE_sequenceFromSpec).
+    """
+    meastime = spec.timing().scope_duration
+
+    return _DPE_makeSequence(hightime=spec.hightime,
+                             trig_delay=spec.trig_delay,
+                             meastime=meastime,
+                             prewaittime=spec.transfertime,
+                             cycletime=spec.cycletime,
+                             no_of_pulses=spec.fast_npts,
+                             pulsehigh=spec.pulsehigh,
+                             SR=spec.SR, segname='high',
+                             event_jump=event_jump)
+
+
+def _DPE_sequenceFromSpec(spec, event_jump=False):
+    """
+    A fresh copy of the (memoized) base sequence of a spec
+    """
+    return copy.deepcopy(_DPE_specSequence(spec, event_jump))
+
+
 @check_kwargs
 def doPulsedExperiment(fast_axis=None, slow_axis=None,
                        slow_start=None, slow_stop=None, slow_npts=None,
@@ -544,82 +965,106 @@ def doPulsedExperiment(fast_axis=None, slow_axis=None,
                        demod_freq=None,
                        # AWG setting
                        awg_channel=None,
-                       awg=None, ZI=None, keysight=None):
+                       awg=None, ZI=None, keysight=None,
+                       *, stop_criterion=None, pipelined=False):
     """
     Top level function for performing pulsed experiments, i.e. sending a
     single square pulse riding on a ramp to the sample and measuring by
     demodulating and shining RF with a ZI UHF-LI
-    """
-
-    # INPUT VALIDATORS
-    fa_vals = ['ramp']
-    sa_vals = ['dt']  # TODO: add 'amp' and maybe even DC
 
-    # VALIDATION
-    if fast_axis not in fa_vals:
-        raise NotImplementedError('Fast axis specifier '
-                                  'must be in {}.'.format(fa_vals))
-    if slow_axis not in sa_vals:
-        raise NotImplementedError('Slow axis specifier '
-                                  'must be in {}.'.format(sa_vals))
+    The slow axis is either 'dt' (the pulse width, re-uploads the sequence
+    per point) or 'amp' (the pulse amplitude, set via the AWG channel
+    amplitude from a single upload).
 
-    if cycletime < 200e-6:
-        raise ValueError('Cycle time too low. Must be at least 200 mu s')
-    if transfertime < 150e-3:
-        raise ValueError('Transfer time too low. Must be at least 150 ms.')
-
-    # Settings we hide from the experimenalists
-    # trig_duration = 10e-6  # not used currently. Is it needed?
-    SR = 1e9
+    This is a thin wrapper around runPulsedExperiment with a
+    PulsedExperimentSpec made from the arguments. The optional
+    stop_criterion and pipelined are passed on to AverageRampResponse.
+    """
+    spec = PulsedExperimentSpec(fast_axis=fast_axis, slow_axis=slow_axis,
+                                slow_start=slow_start, slow_stop=slow_stop,
+                                slow_npts=slow_npts, fast_start=fast_start,
+                                fast_stop=fast_stop, fast_npts=fast_npts,
+                                n_avgs=n_avgs, pts_per_shot=pts_per_shot,
+                                hightime=hightime, meastime=meastime,
+                                cycletime=cycletime,
+                                transfertime=transfertime,
+                                pulsehigh=pulsehigh, trig_delay=trig_delay,
+                                demod_freq=demod_freq,
+                                awg_channel=awg_channel)
+
+    runPulsedExperiment(spec, awg=awg, ZI=ZI, keysight=keysight,
+                        stop_criterion=stop_criterion, pipelined=pipelined)
+
+
+def runPulsedExperiment(spec, awg, ZI, keysight, *, stop_criterion=None,
+                        pipelined=False):
+    """
+    Perform the pulsed experiment described by a spec.
 
+    Args:
+        spec (PulsedExperimentSpec): The experiment
+        awg (Tektronix_AWG5014): QCoDeS instrument instance
+        ZI (ZIUHFLI): QCoDeS instrument instance
+        keysight (Keysight_33500B): QCoDeS instrument instance
+        stop_criterion (Optional[StopCriterion]): Adaptive averaging, with
+            spec.n_avgs as the maximal number of averages
+        pipelined (bool): See AverageRampResponse
+    """
     # Meas. time calculation
-    meastime, SRstring = _DPE_correct_meastime(meastime, pts_per_shot)
+    timing = spec.timing()
 
     # Prepare the instruments
 
     # Keysight
-    _DPE_prepareKeysight(no_of_pulses=fast_npts, cycletime=cycletime,
-                         ramp_low=fast_start, ramp_high=fast_stop,
+    _DPE_prepareKeysight(no_of_pulses=spec.fast_npts,
+                         cycletime=spec.cycletime,
+                         ramp_low=spec.fast_start, ramp_high=spec.fast_stop,
                          keysight=keysight)
 
     # AWG
-    _DPE_prepareTektronixAWG(awg=awg, awg_channel=awg_channel, SR=SR,
-                             pulsehigh=pulsehigh)
+    _DPE_prepareTektronixAWG(awg=awg, awg_channel=spec.awg_channel,
+                             SR=spec.SR, pulsehigh=spec.pulsehigh)
 
     # ZI UHF-LI
-    _DPE_prepareZIUHFLI(zi=ZI, demod_freq=demod_freq,
-                        pts_per_shot=pts_per_shot, SRstring=SRstring,
-                        no_of_pulses=fast_npts, meastime=meastime)
+    _DPE_prepareZIUHFLI(zi=ZI, demod_freq=spec.demod_freq, timing=timing)
 
     # Build the basesequence
-    base_sequence = _DPE_makeSequence(hightime=hightime, trig_delay=trig_delay,
-                                      meastime=meastime,
-                                      prewaittime=transfertime,
-                                      cycletime=cycletime,
-                                      no_of_pulses=fast_npts,
-                                      pulsehigh=pulsehigh,
-                                      SR=SR, segname='high')
+    base_sequence = _DPE_sequenceFromSpec(spec, event_jump=pipelined)
 
     # Make the two measurement parameters
-    if slow_axis == 'dt':
-        pulseTime = PulseTime(name='pulse_time', basesequence=base_sequence,
-                              pos=3, chan=1, segname='high', awg=awg,
-                              awgchannels=[awg_channel])
+    if spec.slow_axis == 'dt':
+        slow_param = PulseTime(name='pulse_time', basesequence=base_sequence,
+                               pos=3, chan=1, segname='high', awg=awg,
+                               awgchannels=[spec.awg_channel])
+        slow_name = 'pulsetime'
+    elif spec.slow_axis == 'amp':
+        # All amplitudes are played from the same upload
+        package = render_sequence(base_sequence)
+        awg.make_send_and_load_awg_file(*package[:],
+                                        channels=[spec.awg_channel])
+        invalidate_settings(awg)
+        slow_param = PulseAmplitude(name='pulse_amplitude', awg=awg,
+                                    awg_channel=spec.awg_channel,
+                                    basesequence=base_sequence)
+        slow_name = 'pulseamplitude'
 
     # setpoints
-    voltages = np.linspace(fast_start, fast_stop, fast_npts)
+    voltages = np.linspace(spec.fast_start, spec.fast_stop, spec.fast_npts)
 
     ramp_avg = AverageRampResponse(name='ramp_response', awg=awg, zi=ZI,
-                                   no_of_avgs=n_avgs, voltages=voltages,
-                                   awg_channel=awg_channel,
-                                   label='Demod response', unit=None)
-
-    awg.parameters['pulsetime'] = pulseTime
-    pulseTime._instrument = awg
+                                   no_of_avgs=spec.n_avgs, voltages=voltages,
+                                   awg_channel=spec.awg_channel,
+                                   label='Demod response', unit=None,
+                                   pipelined=pipelined,
+                                   stop_criterion=stop_criterion)
+
+    awg.parameters[slow_name] = slow_param
+    slow_param._instrument = awg
     awg.parameters['ramp_avg'] = ramp_avg
     ramp_avg._instrument = awg
 
-    do1d(pulseTime, slow_start, slow_stop, slow_npts, 0, ramp_avg)
+    do1d(slow_param, spec.slow_start, spec.slow_stop, spec.slow_npts, 0,
+         ramp_avg)
 
 
 def showPulsedExperiment(fast_npts=None,
@@ -628,22 +1073,31 @@ def showPulsedExperiment(fast_npts=None,
                          cycletime=None,
                          transfertime=None,
                          pulsehigh=None,
-                         trig_delay=None):
-    """
-    Function to visualise the pulsed experiment
+                         trig_delay=None,
+                         spec=None):
     """
+    Function to visualise the pulsed experiment.
 
-    seq = _DPE_makeSequence(hightime=hightime,
-                            trig_delay=trig_delay,
-                            meastime=meastime,
-                            prewaittime=transfertime,
-                            cycletime=cycletime,
-                            no_of_pulses=fast_npts,
-                            pulsehigh=pulsehigh,
-                            SR=1e9, segname='high')
+    If a PulsedExperimentSpec is given, the other arguments are ignored and
+    exactly the sequence that runPulsedExperiment would upload is shown.
 
+    The sequence is drawn from its description (see preview_sequence), so
+    long transfer times cost nothing.
+    """
 
-    seq.plotSequence()
+    if spec is not None:
+        seq = _DPE_sequenceFromSpec(spec)
+    else:
+        seq = _DPE_makeSequence(hightime=hightime,
+                                trig_delay=trig_delay,
+                                meastime=meastime,
+                                prewaittime=transfertime,
+                                cycletime=cycletime,
+                                no_of_pulses=fast_npts,
+                                pulsehigh=pulsehigh,
+                                SR=1e9, segname='high')
+
+    preview_sequence(seq)
 
 
 def print_all_instruments():
@@ -0,0 +1,142 @@
+# Module file for adaptive averaging.
+# Instead of always averaging a fixed number of times, keep a running
+# mean and standard error per setpoint (Welford's online algorithm) and
+# stop as soon as the trace is resolved well enough, or the time budget
+# for the point is spent.
+
+import time
+
+import numpy as np
+
+
+class RunningStats:
+    """
+    Running mean and variance of repeated traces, per setpoint.
+
+    Single traces are added with Welford's update, batches of traces
+    (e.g. all scope segments of one acquisition) with Chan's formula for
+    combining two sets of statistics, so no trace is ever stored.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = None
+        self._m2 = None
+
+    def add(self, trace):
+        """
+        Add a single trace
+        """
+        trace = np.asarray(trace, dtype=float)
+        if self.count == 0:
+            self.count = 1
+            self.mean = trace.copy()
+            self._m2 = np.zeros_like(self.mean)
+            return
+
+        self.count += 1
+        delta = trace - self.mean
+        self.mean += delta/self.count
+        self._m2 += delta*(trace - self.mean)
+
+    def add_batch(self, traces):
+        """
+        Add several traces at once (first axis: repetitions)
+        """
+        traces = np.asarray(traces, dtype=float)
+        n_b = traces.shape[0]
+        mean_b = traces.mean(axis=0)
+        m2_b = ((traces - mean_b)**2).sum(axis=0)
+
+        if self.count == 0:
+            self.count = n_b
+            self.mean = mean_b
+            self._m2 = m2_b
+            return
+
+        n_a = self.count
+        n = n_a + n_b
+        delta = mean_b - self.mean
+        self.mean = self.mean + delta*n_b/n
+        self._m2 = self._m2 + m2_b + delta**2*n_a*n_b/n
+        self.count = n
+
+    @property
+    def variance(self):
+        if self.count < 2:
+            return np.full_like(self.mean, np.inf)
+        return self._m2/(self.count-1)
+
+    @property
+    def sem(self):
+        """
+        The standard error of the mean, per setpoint
+        """
+        return np.sqrt(self.variance/self.count)
+
+    @property
+    def snr(self):
+        """
+        The contrast of the trace (peak-to-peak of the mean) over its
+        typical (median) standard error. Infinite if there is no error
+        (e.g. a clipped, flat trace), as averaging can not improve it.
+        """
+        noise = np.median(self.sem)
+        if noise == 0:
+            return np.inf
+        return np.ptp(self.mean)/noise
+
+
+class StopCriterion:
+    """
+    When to stop averaging. Averaging stops when any of the given targets
+    is met, but never before min_averages.
+
+    Args:
+        target_sem (Optional[float]): Stop when the largest standard error
+            of all setpoints is below this
+        target_snr (Optional[float]): Stop when RunningStats.snr exceeds
+            this
+        time_budget (Optional[float]): Stop when this much time (s) has
+            been spent on the point
+        min_averages (int): Never stop before this many traces
+        max_acquisitions (int): The maximal number of acquisitions (batches
+            of traces) per point, for acquirers repeating batches
+    """
+
+    def __init__(self, target_sem=None, target_snr=None, time_budget=None,
+                 min_averages=2, max_acquisitions=10):
+
+        if min_averages < 2:
+            raise ValueError('Need at least two averages for an error bar.')
+
+        self.target_sem = target_sem
+        self.target_snr = target_snr
+        self.time_budget = time_budget
+        self.min_averages = min_averages
+        self.max_acquisitions = max_acquisitions
+        self._t_start = None
+
+    def start(self):
+        """
+        Start the clock for a new point
+        """
+        self._t_start = time.perf_counter()
+
+    def done(self, stats):
+        """
+        Whether the averaging of the current point can stop
+        """
+        if stats.count < self.min_averages:
+            return False
+
+        if (self.time_budget is not None and
+                time.perf_counter() - self._t_start > self.time_budget):
+            return True
+        if (self.target_sem is not None and
+                np.max(stats.sem) <= self.target_sem):
+            return True
+        if self.target_snr is not None and stats.snr >= self.target_snr:
+            return True
+
+        return False
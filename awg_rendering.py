@@ -0,0 +1,152 @@
+# Module file for rendering broadbean sequences for the Tektronix AWG5014.
+# A drop-in replacement for Sequence.outputForAWGFile that renders each
+# distinct element only once (the reset, trigger and return elements of a
+# varied sequence are identical across variants), renders in parallel
+# and keeps the waveforms in float32. Sequences with few distinct
+# elements are rendered serially, and the worker processes are kept for
+# the next sequence, since starting them costs more than rendering a
+# handful of elements.
+# NB: the normalisation and the sequencing are read from the private
+# Sequence._awgspecs and Sequence._sequencing of broadbean (as of its
+# 2017 layout: specs keyed 'channel<n>_amplitude'/'channel<n>_offset',
+# sequencing as [trig_wait, nrep, jump_to, goto] per position). Sequences
+# without them are handed to seq.outputForAWGFile instead.
+
+import atexit
+from concurrent.futures import ProcessPoolExecutor
+import json
+
+import numpy as np
+
+# Below this many distinct elements, render in this process
+PARALLEL_MIN_ELEMENTS = 8
+
+# The worker pool, kept between calls (see _executor)
+_pool = None
+_pool_size = None
+
+
+def _element_key(element):
+    """
+    A key identifying elements that render to the same arrays
+    """
+    return json.dumps(element.description, sort_keys=True, default=str)
+
+
+def _render_element(element):
+    """
+    Render a single element to {channel: (wfm, m1, m2)}.
+    Runs in a worker process.
+    """
+    arrays = element.getArrays()
+    return {chan: (np.asarray(arrs['wfm'], dtype=np.float32),
+                   np.asarray(arrs['m1'], dtype=np.uint16),
+                   np.asarray(arrs['m2'], dtype=np.uint16))
+            for chan, arrs in arrays.items()}
+
+
+def _executor(processes):
+    """
+    The worker pool, made on first use and re-made only if a different
+    number of processes is asked for
+    """
+    global _pool, _pool_size
+    if _pool is None or processes != _pool_size:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = ProcessPoolExecutor(max_workers=processes)
+        _pool_size = processes
+    return _pool
+
+
+@atexit.register
+def close():
+    """
+    Shut down the worker pool, if any. It is made again when needed.
+    """
+    global _pool, _pool_size
+    if _pool is not None:
+        _pool.shutdown()
+    _pool = None
+    _pool_size = None
+
+
+def render_sequence(seq, processes=None):
+    """
+    Render a broadbean Sequence into the package expected by
+    Tektronix_AWG5014.make_send_and_load_awg_file, i.e. the same output as
+    seq.outputForAWGFile().
+
+    Identical elements are rendered once and their arrays shared between
+    sequence positions. Like outputForAWGFile, raises a ValueError if the
+    sequence is inconsistent or a waveform exceeds its channel range.
+
+    Args:
+        seq (Sequence): The sequence to render
+        processes (Optional[int]): Number of worker processes. Defaults to
+            the number of CPUs. Use 1 to render in this process, which is
+            also done for fewer than PARALLEL_MIN_ELEMENTS distinct
+            elements.
+
+    Returns:
+        tuple: (waveforms, m1s, m2s, nreps, trig_waits, goto_states,
+            jump_tos, channels)
+    """
+    if not (hasattr(seq, '_awgspecs') and hasattr(seq, '_sequencing')):
+        return seq.outputForAWGFile()
+
+    if not seq.checkConsistency():
+        raise ValueError('Can not generate output. Something is '
+                         'inconsistent. Please run '
+                         'checkConsistency(verbose=True) for more details.')
+
+    positions = list(range(1, seq.length_sequenceelements+1))
+    elements = [seq.element(pos) for pos in positions]
+    keys = [_element_key(elem) for elem in elements]
+
+    unique = {}
+    for key, elem in zip(keys, elements):
+        unique.setdefault(key, elem)
+
+    if processes == 1 or len(unique) < PARALLEL_MIN_ELEMENTS:
+        rendered = [_render_element(elem) for elem in unique.values()]
+    else:
+        rendered = list(_executor(processes).map(_render_element,
+                                                 unique.values()))
+    rendered = dict(zip(unique.keys(), rendered))
+
+    channels = sorted(rendered[keys[0]].keys())
+
+    # normalise to the channel voltage ranges (once per unique element)
+    normalised = {}
+    for key, arrays in rendered.items():
+        normalised[key] = {}
+        for chan in channels:
+            wfm, m1, m2 = arrays[chan]
+            amp = seq._awgspecs['channel{}_amplitude'.format(chan)]
+            offset = seq._awgspecs['channel{}_offset'.format(chan)]
+            wfm = (wfm - offset)/(amp/2)
+            if wfm.size and (wfm.max() > 1 or wfm.min() < -1):
+                raise ValueError('Waveform exceeds the specified range of '
+                                 'channel {}: {} V +/- {} V. Check the '
+                                 'channel voltage ranges.'.format(chan,
+                                                                  offset,
+                                                                  amp/2))
+            normalised[key][chan] = (wfm, m1, m2)
+
+    waveforms = [[normalised[key][chan][0] for key in keys]
+                 for chan in channels]
+    m1s = [[normalised[key][chan][1] for key in keys]
+           for chan in channels]
+    m2s = [[normalised[key][chan][2] for key in keys]
+           for chan in channels]
+
+    # sequencing: [trig_wait, nrep, jump_to, goto]
+    sequencing = [seq._sequencing[pos] for pos in positions]
+    trig_waits = [s[0] for s in sequencing]
+    nreps = [s[1] for s in sequencing]
+    jump_tos = [s[2] for s in sequencing]
+    goto_states = [s[3] for s in sequencing]
+
+    return (waveforms, m1s, m2s, nreps, trig_waits, goto_states, jump_tos,
+            channels)
@@ -1,6 +1,8 @@
 # Module file for conductance measurements with the
 # SR830. Implementing the good ideas of Dave Wecker
+# (and the same ideas for DC currents with the Keysight DMM)
 
+import re
 from typing import Union
 from time import sleep
 import numpy as np
@@ -10,6 +12,8 @@ from qcodes.instrument.parameter import Parameter
 from qcodes.utils.wrappers import _do_measurement
 
 from modules.Majorana.Experiment_init import SR830_T10
+from modules.Majorana.Experiment_init import Keysight_34465A_T10
+from modules.Majorana.settling import sweep_settle_time
 
 
 def do2Dconductance(outer_param: Parameter,
@@ -20,7 +24,10 @@ def do2Dconductance(outer_param: Parameter,
                     inner_start: Union[float, int],
                     inner_stop: Union[float, int],
                     inner_npts: int,
-                    lockin: SR830_T10):
+                    lockin: SR830_T10,
+                    streaming: bool = False,
+                    poll_every: int = 10,
+                    delay: Union[float, str, None] = None):
     """
     Function to perform a sped-up 2D conductance measurement
 
@@ -34,6 +41,16 @@ def do2Dconductance(outer_param: Parameter,
         inner_stop: The inner loop stop voltage
         inner_npts: The number of points in the inner loop
         lockin: The lock-in amplifier to use
+        streaming: If True, the lock-in buffer is read (in binary) while
+            the row is being acquired, so that the end of a long row does
+            not block on one big transfer
+        poll_every: In streaming mode, read the buffer after every this
+            many triggers
+        delay: The wait before each trigger (s). If None, the lock-in time
+            constant plus 2 ms. If 'auto', the settle time of an inner step
+            is computed from the lock-in filter, the QDac slope and the
+            line RC (see settling.py), and the first point of each row
+            also waits for the jump back and the outer step.
     """
     station = qc.Station.default
 
@@ -50,8 +67,68 @@ def do2Dconductance(outer_param: Parameter,
         raise KeyError('Unknown instrument for inner parameter. '
                        'Please add that instrument to the station.')
 
-    tau = sr.time_constant()
-    min_delay = 0.002  # what's the physics behind this number?
+    row_delay = 0
+    if delay is None:
+        tau = sr.time_constant()
+        min_delay = 0.002  # what's the physics behind this number?
+        delay = tau + min_delay
+    elif delay == 'auto':
+        delay = sweep_settle_time(inner_param, inner_start, inner_stop,
+                                  inner_npts, (sr.conductance,))
+        # the first point of a row also settles the jump back and the outer
+        # step
+        row_delay = max(sweep_settle_time(inner_param, inner_start,
+                                          inner_stop, inner_npts,
+                                          (sr.conductance,),
+                                          step=abs(inner_stop-inner_start)),
+                        sweep_settle_time(outer_param, outer_start,
+                                          outer_stop, outer_npts,
+                                          (sr.conductance,)))
+        row_delay = max(row_delay - delay, 0)
+    # extra wait for the next trigger, set at the start of each row
+    pending = [0]
+
+    setpoints = (tuple(np.linspace(inner_start, inner_stop, inner_npts)),)
+
+    if streaming:
+        stream = sr.conductance_stream
+        stream.setpoint_names = (inner_param.name,)
+        stream.setpoint_labels = ('Volts',)
+        stream.setpoint_units = ('V',)
+        stream.setpoints = setpoints
+        stream.shape = (inner_npts,)
+
+        triggers = [0]
+
+        def stream_trigger():
+            sleep(delay + pending[0])
+            pending[0] = 0
+            sr.send_trigger()
+            triggers[0] += 1
+            if triggers[0] % poll_every == 0:
+                stream.poll()
+
+        def start_stream():
+            triggers[0] = 0
+            pending[0] = row_delay
+            stream.start(inner_npts)
+
+        inner_loop = qc.Loop(inner_param.sweep(inner_start,
+                                               inner_stop,
+                                               num=inner_npts)).each(
+                                                   qc.Task(stream_trigger))
+        outer_loop = qc.Loop(outer_param.sweep(outer_start,
+                                               outer_stop,
+                                               num=outer_npts)).each(
+                                                   qc.Task(start_stream),
+                                                   inner_loop,
+                                                   stream)
+
+        set_params = ((inner_param, inner_start, inner_stop),
+                      (outer_param, outer_start, outer_stop))
+        meas_params = (stream,)
+        _do_measurement(outer_loop, set_params, meas_params)
+        return
 
     # Prepare for the first iteration
     # Some of these things have to be repeated during the loop
@@ -65,7 +142,8 @@ def do2Dconductance(outer_param: Parameter,
                                                   inner_npts)),)
 
     def trigger():
-        sleep(tau + min_delay)
+        sleep(delay + pending[0])
+        pending[0] = 0
         sr.send_trigger()
 
     def prepare_buffer():
@@ -79,6 +157,7 @@ def do2Dconductance(outer_param: Parameter,
                                                       inner_npts)),)
 
     def start_buffer():
+        pending[0] = row_delay
         sr.buffer_start()
         sr.conductance.shape = (inner_npts,)  # This is something
 
@@ -93,15 +172,117 @@ def do2Dconductance(outer_param: Parameter,
     inner_loop = qc.Loop(inner_param.sweep(inner_start,
                                            inner_stop,
                                            num=inner_npts)).each(trig_task)
-    outer_loop = qc.Loop(outer_param.sweep(outer_start,
-                                           outer_stop,
-                                           num=outer_npts)).each(start_task,
-                                                                 inner_loop,
-                                                                 prep_buffer_task,
-                                                                 sr.conductance,
-                                                                 reset_task)
+    outer_sweep = outer_param.sweep(outer_start, outer_stop, num=outer_npts)
+    outer_loop = qc.Loop(outer_sweep).each(start_task,
+                                           inner_loop,
+                                           prep_buffer_task,
+                                           sr.conductance,
+                                           reset_task)
 
     set_params = ((inner_param, inner_start, inner_stop),
                   (outer_param, outer_start, outer_stop))
     meas_params = (sr.conductance,)
     _do_measurement(outer_loop, set_params, meas_params)
+
+
+def do2Dcurrent(outer_param: Parameter,
+                outer_start: Union[float, int],
+                outer_stop: Union[float, int],
+                outer_npts: int,
+                inner_param: Parameter,
+                inner_start: Union[float, int],
+                inner_stop: Union[float, int],
+                inner_npts: int,
+                dmm: Keysight_34465A_T10,
+                nplc: float = 1,
+                interval: Union[float, None] = None,
+                init_slope: float = 0.1):
+    """
+    Function to perform a sped-up 2D current measurement. Each row is a
+    single QDac ramp during which the DMM takes timed samples into its
+    buffer, which is then fetched in one go.
+
+    Args:
+        outer_param: The outer loop voltage parameter
+        outer_start: The outer loop start voltage
+        outer_stop: The outer loop stop voltage
+        outer_npts: The number of points in the outer loop
+        inner_param: The inner loop voltage parameter. Must be a QDac
+            channel voltage (chXX_v), since the QDac does the ramp.
+        inner_start: The inner loop start voltage
+        inner_stop: The inner loop stop voltage
+        inner_npts: The number of points in the inner loop
+        dmm: The DMM to use
+        nplc: The DMM integration time in power line cycles
+        interval: The time between samples (s). Defaults to the
+            integration time (50 Hz mains) plus 20%.
+        init_slope: The slope (V/s) for going back to the start of a row
+    """
+    station = qc.Station.default
+
+    if inner_npts < 2:
+        raise ValueError('The inner loop needs at least two points, since '
+                         'each row is a single ramp.')
+
+    # Validate the instruments
+    if dmm.name not in station.components:
+        raise KeyError('Unknown DMM! Refusing to proceed until the '
+                       'DMM has been added to the station.')
+    if outer_param._instrument.name not in station.components:
+        raise KeyError('Unknown instrument for outer parameter. '
+                       'Please add that instrument to the station.')
+    if inner_param._instrument.name not in station.components:
+        raise KeyError('Unknown instrument for inner parameter. '
+                       'Please add that instrument to the station.')
+    if not re.match(r'ch\d+_v$', inner_param.name):
+        raise ValueError('The inner parameter must be a QDac channel '
+                         'voltage.')
+
+    qdac = inner_param._instrument
+    channel_id = int(re.findall(r'\d+', inner_param.name)[0])
+    slope_param = qdac.parameters['ch{:02}_slope'.format(channel_id)]
+
+    if interval is None:
+        interval = 1.2*nplc/50
+    sweep_time = (inner_npts-1)*interval
+    slope = abs(inner_stop-inner_start)/sweep_time
+
+    buffer = dmm.ivconv_buffer
+    buffer.prepare(inner_npts, nplc=nplc, interval=interval)
+    buffer.setpoint_names = (inner_param.name,)
+    buffer.setpoint_labels = ('Volts',)
+    buffer.setpoint_units = ('V',)
+    buffer.setpoints = (tuple(np.linspace(inner_start,
+                                          inner_stop,
+                                          inner_npts)),)
+
+    def go_to_start():
+        slope_param(init_slope)
+        ramp_time = abs(inner_param.get()-inner_start)/init_slope
+        inner_param.set(inner_start)
+        sleep(ramp_time + 0.03)
+
+    def sweep_row():
+        # the DMM starts sampling at INIT; the QDac ramp starts right after.
+        # No waiting here, the fetch blocks until the buffer is full.
+        slope_param(slope)
+        buffer.start()
+        inner_param.set(inner_stop)
+
+    outer_loop = qc.Loop(outer_param.sweep(outer_start,
+                                           outer_stop,
+                                           num=outer_npts)).each(
+                                               qc.Task(go_to_start),
+                                               qc.Task(sweep_row),
+                                               buffer)
+
+    set_params = ((inner_param, inner_start, inner_stop),
+                  (outer_param, outer_start, outer_stop))
+    meas_params = (buffer,)
+    try:
+        _do_measurement(outer_loop, set_params, meas_params)
+    finally:
+        # also after an error, so that the QDac steps and the DMM reads
+        # single values again
+        slope_param('Inf')
+        buffer.restore()
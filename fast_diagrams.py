@@ -1,5 +1,18 @@
+import logging
+import time
+
 import numpy as np
-from qcodes.instrument.parameter import ArrayParameter
+import qcodes as qc
+from qcodes.instrument.parameter import ArrayParameter, ManualParameter
+
+from modules.Majorana.adaptive_averaging import RunningStats
+from modules.Majorana.instrument_config import apply_settings
+from modules.Majorana.keysight_ramps import FastRamp, configure_fast_ramps
+from modules.Majorana.video_mode import VideoMode
+from modules.Majorana.zi_timing import (ZI_MAX_SCOPE_LENGTH, fast_timing,
+                                        solve_timing)
+
+log = logging.getLogger(__name__)
 
 
 class Scope_avg(ArrayParameter):
@@ -14,6 +27,16 @@ class Scope_avg(ArrayParameter):
             raise ValueError('Channel must be 1 or 2')
 
         self.channel = channel
+        self.calibration = None
+        # 'host': transfer all segments and average here
+        # 'device': let the scope module average, transfer one trace
+        self.averaging = 'host'
+        # adaptive averaging (host averaging only): repeat the acquisition
+        # of growing batches of segments until the criterion is met
+        self.stop_criterion = None
+        self.last_stats = None
+        # the data server scope module for device averaging, made once
+        self._scope_module = None
 
     def make_setpoints(self, sp_start, sp_stop, sp_npts):
         """
@@ -23,16 +46,272 @@ class Scope_avg(ArrayParameter):
         self.unit = self._instrument.Scope.units[self.channel-1]
         self.setpoints = (tuple(np.linspace(sp_start, sp_stop, sp_npts)),)
         self.has_setpoints = True
+        self.calibration = None
+
+    def apply_calibration(self, calibration):
+        """
+        Use a measured ramp-to-sample mapping (see calibrate_fast_ramp).
+        Each averaged trace is then resampled onto the (uniform) setpoints,
+        so that dead time, rise time and trigger latency of the sawtooth do
+        not distort the fast axis. Setpoints outside the measured range
+        become NaN.
+
+        Args:
+            calibration (np.ndarray): The voltage of the ramp at each scope
+                sample. Must have one entry per sample.
+        """
+        if not self.has_setpoints:
+            raise ValueError('Setpoints not made. Run make_setpoints')
+        if len(calibration) != self.shape[0]:
+            raise ValueError('Calibration does not match the scope length: '
+                             '{} != {}'.format(len(calibration),
+                                               self.shape[0]))
+
+        # sort once, so that get only has to do a single interpolation
+        self._cal_order = np.argsort(calibration, kind='mergesort')
+        self._cal_voltages = np.asarray(calibration)[self._cal_order]
+        self._cal_grid = np.array(self.setpoints[0])
+        self.calibration = calibration
+
+    def get(self):
+
+        if not self.has_setpoints:
+            raise ValueError('Setpoints not made. Run make_setpoints')
+
+        trace = None
+        if self.averaging == 'device':
+            try:
+                trace = self._get_device_averaged()
+            except (RuntimeError, KeyError, AttributeError) as e:
+                log.warning('Device averaging failed ({}), falling back to '
+                            'host averaging.'.format(e))
+                self.averaging = 'host'
+                self.clear_scope_module()
+
+        if trace is None and self.stop_criterion is not None:
+            trace = self._get_adaptive()
+
+        if trace is None:
+            data = self._instrument.Scope.get()[self.channel-1]
+            trace = np.mean(data, 0)
+
+        if self.calibration is not None:
+            trace = np.interp(self._cal_grid, self._cal_voltages,
+                              trace[self._cal_order],
+                              left=np.nan, right=np.nan)
+
+        return trace
+
+    def _get_adaptive(self):
+        """
+        Repeat the acquisition until the stop criterion is met (or its
+        max_acquisitions is reached), keeping running statistics of all
+        segments so far. The first batch is only min_averages segments,
+        and the batch size doubles up to the configured segment count, so
+        that a clean trace stops early.
+        """
+        zi = self._instrument
+        criterion = self.stop_criterion
+        n_segments = int(zi.scope_segments_count.get_latest())
+
+        stats = RunningStats()
+        criterion.start()
+
+        batch = min(criterion.min_averages, n_segments)
+        current = n_segments
+        try:
+            for n in range(criterion.max_acquisitions):
+                if batch != current:
+                    zi.scope_segments_count(batch)
+                    zi.Scope.prepare_scope()
+                    current = batch
+                stats.add_batch(zi.Scope.get()[self.channel-1])
+                if criterion.done(stats):
+                    break
+                batch = min(2*batch, n_segments)
+        finally:
+            if current != n_segments:
+                zi.scope_segments_count(n_segments)
+                zi.Scope.prepare_scope()
+
+        self.last_stats = stats
+
+        return stats.mean
+
+    def _device_scope(self):
+        """
+        The scope module of the data server used for device averaging.
+        Made on first use and kept subscribed to the scope wave.
+        """
+        if self._scope_module is None:
+            zi = self._instrument
+            scope = zi.daq.scopeModule()
+            scope.set('scopeModule/mode', 1)  # time domain
+            scope.set('scopeModule/historylength', 1)
+            scope.subscribe('/{}/scopes/0/wave'.format(zi.device))
+            self._scope_module = scope
+        return self._scope_module
+
+    def clear_scope_module(self):
+        """
+        End the thread of the device averaging scope module, if any
+        """
+        if self._scope_module is not None:
+            self._scope_module.clear()
+            self._scope_module = None
+
+    def _get_device_averaged(self, timeout=10):
+        """
+        Acquire one trace averaged by the scope module of the data server.
+
+        The scope segments are switched off and the segment count is used
+        as the number of records to average instead, so only a single
+        averaged trace is read back. NB: the scope module averages
+        exponentially with weight N, which for N records is close to, but
+        not exactly, the plain mean.
+        """
+        zi = self._instrument
+        daq = zi.daq
+        scopenode = '/{}/scopes/0/'.format(zi.device)
+
+        n_avgs = int(zi.scope_segments_count.get_latest())
+        segments = daq.getInt(scopenode + 'segments/enable')
+
+        scope = self._device_scope()
+        scope.set('scopeModule/averager/weight', n_avgs)
+        scope.set('scopeModule/averager/restart', 1)
+
+        daq.setInt(scopenode + 'segments/enable', 0)
+        daq.setInt(scopenode + 'enable', 1)
+        daq.sync()
+
+        try:
+            scope.execute()
+            records = scope.getInt('scopeModule/records')
+            t_start = time.time()
+            while scope.getInt('scopeModule/records') < records + n_avgs:
+                if time.time() - t_start > timeout:
+                    raise RuntimeError('Timeout while averaging on device')
+                time.sleep(0.005)
+            result = scope.read(True)
+        finally:
+            scope.finish()
+            daq.setInt(scopenode + 'enable', 0)
+            daq.setInt(scopenode + 'segments/enable', segments)
+            daq.sync()
+
+        wave = result[scopenode + 'wave'][-1][0]['wave']
+
+        return np.asarray(wave[self.channel-1])
+
+
+# Measured ramp-to-sample mappings, one per timing configuration
+_RAMP_CALIBRATIONS = {}
+
+
+def calibrate_fast_ramp(timing, fast_v_start, fast_v_stop,
+                        calibration_signal, calibration_gain=1, deg=5,
+                        force=False):
+    """
+    Measure the actual voltage of the Keysight sawtooth at each scope
+    sample, by recording the Keysight output looped into a ZI input.
+    The result is cached per configuration, so it is measured only once.
+
+    The ZI and Keysight must already be set up for the measurement.
+
+    Args:
+        timing (FastTiming): The timing of the measurement
+        fast_v_start: Fast axis start voltage
+        fast_v_stop: Fast axis stop voltage
+        calibration_signal: The ZI input carrying the Keysight output,
+                            e.g. 'Signal Input 2'
+        calibration_gain: ZI volts per Keysight volt in the loop
+        deg: Degree of the polynomial smoothing the measured ramp
+        force: Re-measure even if a calibration is cached
+
+    Returns:
+        np.ndarray: The ramp voltage at each scope sample
+    """
+    key = (timing, fast_v_start, fast_v_stop, calibration_signal,
+           calibration_gain, deg)
+    if key in _RAMP_CALIBRATIONS and not force:
+        return _RAMP_CALIBRATIONS[key]
+
+    old_input = zi.scope_channel2_input.get_latest()
+    apply_settings(zi, {'scope_channel2_input': calibration_signal})
+    zi.Scope.prepare_scope()
+
+    trace = np.mean(zi.Scope.get()[1], 0)/calibration_gain
+
+    if old_input is not None:
+        apply_settings(zi, {'scope_channel2_input': old_input})
+
+    # smooth away the noise and force a monotonic mapping. Polynomial.fit
+    # scales the sample indices to [-1, 1], which keeps the fit well
+    # conditioned for thousands of samples
+    samples = np.arange(len(trace))
+    fitted = np.polynomial.Polynomial.fit(samples, trace, deg)(samples)
+    calibration = np.maximum.accumulate(fitted)
+
+    _RAMP_CALIBRATIONS[key] = calibration
+
+    return calibration
+
+
+class Scope_frame(ArrayParameter):
+    """
+    A full 2D frame of a hardware raster: one scope segment per line of
+    the fast sawtooth, the slow sawtooth stepping through the lines.
+
+    The scope is armed at an arbitrary point of the slow ramp, so the
+    segments hold a cyclically shifted frame. If the slow ramp (or a copy
+    of it) is recorded on scope channel 2, the frame is rolled back into
+    place by finding the line where the slow ramp resets.
+    """
+
+    def __init__(self, name, **kwargs):
+
+        super().__init__(name, shape=(1, 1), **kwargs)
+        self.has_setpoints = False
+        self.align = True
+
+    def make_setpoints(self, slow_start, slow_stop, n_lines,
+                       fast_start, fast_stop, fast_npts):
+        """
+        Makes setpoints and prepares the frame grabber (updates its unit).
+        Each line is labelled with the slow voltage at its middle.
+        """
+        step = (slow_stop-slow_start)/n_lines
+        slow = np.linspace(slow_start+step/2, slow_stop-step/2, n_lines)
+        fast = tuple(np.linspace(fast_start, fast_stop, fast_npts))
+
+        self.shape = (n_lines, fast_npts)
+        self.unit = self._instrument.Scope.units[0]
+        self.setpoints = (tuple(slow), (fast,)*n_lines)
+        self.has_setpoints = True
 
     def get(self):
 
         if not self.has_setpoints:
             raise ValueError('Setpoints not made. Run make_setpoints')
 
-        data = self._instrument.Scope.get()[self.channel-1]
-        return np.mean(data, 0)
+        data = self._instrument.Scope.get()
+        frame = np.asarray(data[0])
+
+        if self.align:
+            reference = np.mean(data[1], axis=1)
+            frame = np.roll(frame, -int(np.argmin(reference)), axis=0)
+
+        return frame
 
 
+try:
+    zi.add_parameter('scope_frame',
+                     label='',
+                     parameter_class=Scope_frame)
+except KeyError:
+    pass
+
 try:
     zi.add_parameter('scope_avg_ch1',
                      channel=1,
@@ -76,12 +355,52 @@ def prepare_measurement(keysight_low_V, keysight_high_V, scope_avger, qdac_fast_
 
 
 
+def _scope_timing(zi_samplingrate, zi_scope_length, zi_meastime,
+                  zi_max_points, trigger_holdoff, zi_trig_delay, segments):
+    """
+    The timing of a segmented acquisition: solved for the desired
+    measurement time per segment within the point budget if zi_meastime is
+    given, else from the given sample rate and scope length.
+    """
+    if zi_meastime is not None:
+        return solve_timing(zi_meastime, trigger_holdoff, zi_trig_delay,
+                            segments, zi_max_points)
+    return fast_timing(zi_samplingrate, zi_scope_length, trigger_holdoff,
+                       zi_trig_delay, segments)
+
+
+def _zi_scope_settings(timing, zi_trig_signal, zi_trig_hyst, zi_trig_level):
+    """
+    The ZI scope settings for a sawtooth-triggered segmented acquisition
+    """
+    return {'scope_samplingrate': timing.SRstring,
+            'scope_length': timing.scope_length,
+            'scope_channels': 3,
+            'scope_trig_holdoffseconds': timing.trigger_holdoff,
+            'scope_trig_enable': 'ON',
+            'scope_trig_signal': zi_trig_signal,
+            'scope_trig_slope': 'Rise',
+            'scope_trig_hystmode': 'absolute',
+            'scope_trig_hystabsolute': zi_trig_hyst,
+            'scope_trig_gating_enable': 'OFF',
+            'scope_trig_holdoffmode': 's',
+            'scope_trig_reference': 0,
+            'scope_segments': 'ON',
+            'scope_segments_count': timing.segments,
+            'scope_trig_level': zi_trig_level,
+            'scope_trig_delay': timing.trigger_delay}
+
+
 def fast_charge_diagram(keysight_channel, fast_v_start, fast_v_stop, n_averages,
                         qdac_channel, q_start, q_stop, npoints, delay, qdac_fast_channel,
                         scope_signal, zi_trig_signal='Trig Input 1',
                         trigger_holdoff=60e-6, zi_samplingrate='14.0 MHz', zi_scope_length=4096,
                         zi_trig_hyst=0, zi_trig_level=.5, zi_trig_delay = 0, print_settings=False,
-                        tasks_to_perform=None):
+                        tasks_to_perform=None, generator=None,
+                        calibration_signal=None, calibration_gain=1,
+                        averaging='host', stop_criterion=None,
+                        zi_meastime=None,
+                        zi_max_points=ZI_MAX_SCOPE_LENGTH):
     """
     Args:
         keysight_channel:
@@ -102,8 +421,32 @@ def fast_charge_diagram(keysight_channel, fast_v_start, fast_v_stop, n_averages,
         zi_trig_level:
         zi_trig_delay: Should be the rise time of your signal/trigger signal 
                        For Keysight sawtooth it is 6e-7s.
+        generator: The Keysight generator driving the fast axis, either an
+                   instance or one of keysight_gen_left/mid/right.
+                   Defaults to keysight.
+        calibration_signal: If given, the ZI input carrying the Keysight
+                   output. The ramp is then calibrated (once per
+                   configuration) and the fast axis resampled onto a
+                   uniform voltage grid.
+        calibration_gain: ZI volts per Keysight volt in the calibration loop
+        averaging: 'host' to transfer all n_averages segments and average
+                   them here, 'device' to let the ZI scope module average
+                   and transfer a single trace per point.
+        stop_criterion: A StopCriterion for adaptive averaging (host
+                   averaging only). Batches of segments, growing from
+                   its min_averages to n_averages, are then acquired
+                   until it is met.
+        zi_meastime: The desired duration of each scope segment (s). If
+                   given, the sample rate and scope length are solved for
+                   (see zi_timing.solve_timing) instead of taken from
+                   zi_samplingrate and zi_scope_length.
+        zi_max_points: The point budget per segment when solving for
+                   zi_meastime
     """
 
+    if averaging not in ['host', 'device']:
+        raise ValueError('Averaging must be either "host" or "device".')
+
     if keysight_channel not in ['ch01', 'ch02']:
         raise ValueError('Invalid keysight channel. Must be either "ch01" or "ch02".')
 
@@ -116,88 +459,63 @@ def fast_charge_diagram(keysight_channel, fast_v_start, fast_v_stop, n_averages,
     # we need to recalculate the scope duration, sawtooth amplitude
     # and keysight frequency.
 
-    zi.scope_samplingrate.set(zi_samplingrate)
-    zi.scope_length.set(zi_scope_length)
-    zi.daq.sync()
-
-    scope_duration = zi.scope_duration()
-    scope_duration_compensated = trigger_holdoff + scope_duration + zi_trig_delay
-    key_frequency = 1/scope_duration_compensated
-
-    asym = trigger_holdoff/scope_duration_compensated  # dead time / meas. time
-
-    # # obsolete next line
-    # additional_sawtooth_amplitude = keysight_amplitude * ((trigger_holdoff)/scope_duration)
-
+    timing = _scope_timing(zi_samplingrate, zi_scope_length, zi_meastime,
+                           zi_max_points, trigger_holdoff, zi_trig_delay,
+                           n_averages)
+    key_frequency = timing.key_frequency
 
     keysight_amplitude = abs(fast_v_stop-fast_v_start)
     key_offset = fast_v_start + keysight_amplitude/2
     # fast_v_start -= additional_sawtooth_amplitude
 
-    zi.scope_channels(3)
-    zi.scope_trig_holdoffseconds.set(trigger_holdoff)
-
-    zi.scope_trig_enable.set('ON')
-    zi.scope_trig_signal.set(zi_trig_signal)
-    zi.scope_trig_slope.set('Rise')
-
-    zi.scope_trig_hystmode('absolute')
-    zi.scope_trig_hystabsolute.set(zi_trig_hyst)
-
-    zi.scope_trig_gating_enable.set('OFF')
-    zi.scope_trig_holdoffmode.set('s')
-
-    zi.scope_trig_reference.set(0)
-    zi.scope_segments('ON')
-    zi.scope_segments_count(n_averages)
-
-    zi.scope_trig_level.set(zi_trig_level)
-    zi.scope_trig_delay.set(zi_trig_delay)
-    zi.daq.sync()
-    if keysight_channel == 'ch01':
-        keysight.ch1_function_type('RAMP')
-        keysight.ch1_ramp_symmetry(100*(1-asym))
-        keysight.ch1_phase(180*(1+asym))
-        keysight.ch1_amplitude_unit('VPP')
-        keysight.ch1_amplitude(keysight_amplitude)
-        keysight.ch1_offset(key_offset)
-        keysight.ch1_frequency(key_frequency)
-        keysight.sync_source(1)
-        keysight.ch1_output('ON')
-    elif keysight_channel == 'ch02':
-        keysight.ch2_function_type('RAMP')
-        keysight.ch2_ramp_symmetry(100*(1-asym))
-        keysight.ch2_phase(180*(1+asym))
-        keysight.ch2_amplitude_unit('VPP')
-        keysight.ch2_amplitude(keysight_amplitude)
-        keysight.ch2_offset(key_offset)
-        keysight.ch2_frequency(key_frequency)
-        keysight.sync_source(2)
-        keysight.ch2_output('ON')
-    else:
-        raise ValueError('Select a valid Keysight channel.')
+    if len(scope_signal) > 2:
+        raise ValueError('Select only one or two scope signals.')
+
+    # The whole ZI setup goes out as one transaction with a single sync
+    zi_settings = _zi_scope_settings(timing, zi_trig_signal, zi_trig_hyst,
+                                     zi_trig_level)
+    for ii, sig in enumerate(scope_signal):
+        zi_settings['scope_channel{}_input'.format(ii+1)] = sig
+
+    apply_settings(zi, zi_settings)
+
+    if generator is None:
+        generator = keysight
+    fast_ramp = FastRamp(generator, {'ch01': 1, 'ch02': 2}[keysight_channel])
+    configure_fast_ramps({fast_ramp: fast_ramp.settings(keysight_amplitude,
+                                                        key_offset,
+                                                        key_frequency,
+                                                        timing.ramp_symmetry,
+                                                        timing.phase)},
+                         sync_ramp=fast_ramp)
+    fast_ramp.output('ON')
+    # the sync output triggers the ZI
+    fast_ramp.keysight.sync_output('ON')
 
     scope_avger = []
     zi_averager = {0: zi.scope_avg_ch1,
                    1: zi.scope_avg_ch2}
 
+    if calibration_signal is not None:
+        calibration = calibrate_fast_ramp(timing, fast_v_start, fast_v_stop,
+                                          calibration_signal,
+                                          calibration_gain)
+
     for ii, sig in enumerate(scope_signal):
-        if ii == 0:
-            zi.scope_channel1_input(sig)
-        elif ii == 1:
-            zi.scope_channel2_input(sig)
-        else:
-            raise ValueError('Select only one or two scope signals.')
         zi_averager[ii].label = sig
+        zi_averager[ii].averaging = averaging
+        zi_averager[ii].stop_criterion = stop_criterion
 
         try:
             scope_avger.append(zi_averager[ii])
             prepare_measurement(fast_v_start, fast_v_stop, zi_averager[ii],
                                 qdac_fast_channel)
         except KeyError:
-            raise ValueError('Invalid scope_channel: {}'.format(ch))
+            raise ValueError('Invalid scope_channel: {}'.format(ii))
+
+        if calibration_signal is not None:
+            zi_averager[ii].apply_calibration(calibration)
 
-    keysight.sync_output('ON')
     # set up UHFLI
     # zi.scope_mode.set('Time Domain')  # currently done in ZI driver
 
@@ -208,7 +526,8 @@ def fast_charge_diagram(keysight_channel, fast_v_start, fast_v_stop, n_averages,
         print('keysight amplitude: {}'.format(keysight_amplitude))
         print('keysight offset: {}'.format(key_offset))
         print('\n')
-        print('zi_samplingrate: {}'.format(zi_samplingrate))
+        print('zi_samplingrate: {}'.format(timing.SRstring))
+        print('zi_scope_length: {}'.format(timing.scope_length))
         print('zi_trig_level: {}'.format(zi_trig_level))
         print('zi_trig_delay: {}'.format(zi_trig_delay))
         print('zi_trig_hyst: {}'.format(zi_trig_hyst))
@@ -221,17 +540,198 @@ def fast_charge_diagram(keysight_channel, fast_v_start, fast_v_stop, n_averages,
             #plot, data = do1d_M(qdac_channel, q_start, q_stop, npoints, delay, scope_avger, *tasks_to_perform)
             plot, data = do1d(qdac_channel, q_start, q_stop, npoints, delay, *scope_avger, *tasks_to_perform)
 
-        if keysight_channel == 'ch01':
-            keysight.ch1_output('OFF')
-        elif keysight_channel == 'ch02':
-            keysight.ch2_output('OFF')
+        fast_ramp.output('OFF')
 
     except KeyboardInterrupt:
-        if keysight_channel == 'ch01':
-            keysight.ch1_output('OFF')
-        elif keysight_channel == 'ch02':
-            keysight.ch2_output('OFF')
+        fast_ramp.output('OFF')
 
         print('Measurement interrupted.')
 
     return plot, data
+
+
+def setup_raster(fast_channel, fast_v_start, fast_v_stop,
+                 slow_channel, slow_v_start, slow_v_stop, n_lines,
+                 scope_signal, slow_reference_signal='Signal Input 2',
+                 zi_trig_signal='Trig Input 1', trigger_holdoff=60e-6,
+                 zi_samplingrate='14.0 MHz', zi_scope_length=4096,
+                 zi_trig_hyst=0, zi_trig_level=.5, zi_trig_delay=0,
+                 generator=None, zi_meastime=None,
+                 zi_max_points=ZI_MAX_SCOPE_LENGTH):
+    """
+    Configure the ZI and one Keysight for a hardware raster: a fast
+    sawtooth on one channel and a slow sawtooth, lasting exactly n_lines
+    fast periods, on the other. The ZI captures the whole frame as
+    n_lines segments in one acquisition.
+
+    Args:
+        fast_channel: Keysight channel of the fast axis ('ch01' or 'ch02')
+        fast_v_start: Fast axis start voltage
+        fast_v_stop: Fast axis stop voltage
+        slow_channel: Keysight channel of the slow axis ('ch01' or 'ch02')
+        slow_v_start: Slow axis start voltage
+        slow_v_stop: Slow axis stop voltage
+        n_lines: Number of lines (fast sweeps) per frame
+        scope_signal: The ZI signal to record on scope channel 1
+        slow_reference_signal: The ZI input carrying a copy of the slow
+                               ramp, used to align the frames.
+        generator: The Keysight generator, either an instance or one of
+                   keysight_gen_left/mid/right. Defaults to keysight.
+        (the remaining arguments are as for fast_charge_diagram)
+
+    Returns:
+        tuple (FastTiming, FastRamp, FastRamp): the timing and the fast and
+            slow ramps
+    """
+    channels = {'ch01': 1, 'ch02': 2}
+    if fast_channel not in channels or slow_channel not in channels:
+        raise ValueError('Invalid keysight channel. Must be either "ch01" '
+                         'or "ch02".')
+    if fast_channel == slow_channel:
+        raise ValueError('The fast and slow axes need separate channels.')
+
+    if generator is None:
+        generator = keysight
+
+    timing = _scope_timing(zi_samplingrate, zi_scope_length, zi_meastime,
+                           zi_max_points, trigger_holdoff, zi_trig_delay,
+                           n_lines)
+
+    zi_settings = _zi_scope_settings(timing, zi_trig_signal, zi_trig_hyst,
+                                     zi_trig_level)
+    zi_settings['scope_channel1_input'] = scope_signal
+    zi_settings['scope_channel2_input'] = slow_reference_signal
+    apply_settings(zi, zi_settings)
+
+    fast_ramp = FastRamp(generator, channels[fast_channel])
+    slow_ramp = FastRamp(generator, channels[slow_channel])
+
+    fast_amplitude = abs(fast_v_stop-fast_v_start)
+    slow_amplitude = abs(slow_v_stop-slow_v_start)
+
+    configure_fast_ramps(
+        {fast_ramp: fast_ramp.settings(fast_amplitude,
+                                       fast_v_start + fast_amplitude/2,
+                                       timing.key_frequency,
+                                       timing.ramp_symmetry,
+                                       timing.phase),
+         slow_ramp: slow_ramp.settings(slow_amplitude,
+                                       slow_v_start + slow_amplitude/2,
+                                       timing.burst_frequency,
+                                       100, 180)},
+        sync_ramp=fast_ramp)
+
+    zi.Scope.prepare_scope()
+    zi.scope_frame.label = scope_signal
+    zi.scope_frame.make_setpoints(slow_v_start, slow_v_stop, n_lines,
+                                  fast_v_start, fast_v_stop,
+                                  zi.scope_length())
+
+    fast_ramp.output('ON')
+    slow_ramp.output('ON')
+    generator.sync_output('ON')
+
+    return timing, fast_ramp, slow_ramp
+
+
+def fast_charge_diagram_2d(fast_channel, fast_v_start, fast_v_stop,
+                           slow_channel, slow_v_start, slow_v_stop, n_lines,
+                           scope_signal, n_frames=1,
+                           fast_label='Fast axis', slow_label='Slow axis',
+                           print_settings=False, **raster_kwargs):
+    """
+    A charge diagram where both axes are swept by the Keysight, i.e. with
+    no QDac stepping. Each frame is a single ZI acquisition.
+
+    Args:
+        fast_channel: Keysight channel of the fast axis ('ch01' or 'ch02')
+        fast_v_start: Fast axis start voltage
+        fast_v_stop: Fast axis stop voltage
+        slow_channel: Keysight channel of the slow axis ('ch01' or 'ch02')
+        slow_v_start: Slow axis start voltage
+        slow_v_stop: Slow axis stop voltage
+        n_lines: Number of lines per frame
+        scope_signal: The ZI signal to record
+        n_frames: Number of frames to acquire
+        fast_label: Label of the fast axis
+        slow_label: Label of the slow axis
+        print_settings: Whether to print the Keysight and ZI settings
+        **raster_kwargs: Passed on to setup_raster
+
+    Returns:
+        data: the dataset with all frames
+    """
+    timing, fast_ramp, slow_ramp = setup_raster(fast_channel, fast_v_start,
+                                                fast_v_stop, slow_channel,
+                                                slow_v_start, slow_v_stop,
+                                                n_lines, scope_signal,
+                                                **raster_kwargs)
+
+    zi.scope_frame.setpoint_names = ('slow_voltage', 'fast_voltage')
+    zi.scope_frame.setpoint_labels = (slow_label, fast_label)
+    zi.scope_frame.setpoint_units = ('V', 'V')
+
+    if print_settings:
+        print('keysight fast frequency: {}'.format(timing.key_frequency))
+        print('keysight slow frequency: {}'.format(timing.burst_frequency))
+        print('frame time: {}'.format(timing.frame_time))
+        print('\n')
+        print('zi_samplingrate: {}'.format(timing.SRstring))
+        print('zi_scope_length: {}'.format(timing.scope_length))
+
+    frame = ManualParameter('frame', label='Frame')
+    loop = qc.Loop(frame[0:n_frames:1]).each(zi.scope_frame)
+    data = loop.get_data_set(name='fast_charge_diagram_2d')
+
+    try:
+        loop.run()
+    except KeyboardInterrupt:
+        print('Measurement interrupted.')
+    finally:
+        fast_ramp.output('OFF')
+        slow_ramp.output('OFF')
+
+    return data
+
+
+def video_mode(fast_channel, fast_v_start, fast_v_stop,
+               slow_channel, slow_v_start, slow_v_stop, n_lines,
+               scope_signal, buffer_size=10, averages=1,
+               fast_label='Fast axis', slow_label='Slow axis',
+               **raster_kwargs):
+    """
+    Start a continuous hardware-raster charge diagram for tuning.
+
+    The instruments are set up once; frames then stream into the ring
+    buffer of the returned VideoMode until its stop method is called
+    (which also switches the Keysight outputs off). Use
+    VideoMode.latest for live viewing and VideoMode.snapshot to save a
+    frame.
+
+    Args:
+        (see fast_charge_diagram_2d)
+        buffer_size: Number of recent frames to keep
+        averages: Number of frames in the running average
+
+    Returns:
+        VideoMode: the running acquisition
+    """
+    timing, fast_ramp, slow_ramp = setup_raster(fast_channel, fast_v_start,
+                                                fast_v_stop, slow_channel,
+                                                slow_v_start, slow_v_stop,
+                                                n_lines, scope_signal,
+                                                **raster_kwargs)
+
+    zi.scope_frame.setpoint_names = ('slow_voltage', 'fast_voltage')
+    zi.scope_frame.setpoint_labels = (slow_label, fast_label)
+    zi.scope_frame.setpoint_units = ('V', 'V')
+
+    def outputs_off():
+        fast_ramp.output('OFF')
+        slow_ramp.output('OFF')
+
+    video = VideoMode(zi.scope_frame, buffer_size=buffer_size,
+                      averages=averages, on_stop=outputs_off)
+    video.start()
+
+    return video
@@ -0,0 +1,99 @@
+# Script checking that the helper modules import fast.
+# Each module is imported in a fresh interpreter with -X importtime, the
+# cumulative import time of the module is compared to the budget and the
+# slowest imports it pulls in are listed.
+#
+# Usage: python import_budget.py [--budget 1.0] [--top 10] [module ...]
+
+import argparse
+import subprocess
+import sys
+
+DEFAULT_MODULES = ('modules.Majorana.reload_settings',
+                   'modules.Majorana.majorana_wrappers')
+DEFAULT_BUDGET = 1.0  # (s)
+
+
+def parse_importtime(output):
+    """
+    Parse the -X importtime output
+
+    Returns:
+        list: (module name, self time (s), cumulative time (s)) per import
+    """
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3:
+            continue
+        try:
+            self_us = int(fields[0])
+            cumulative_us = int(fields[1])
+        except ValueError:
+            # the header line
+            continue
+        imports.append((fields[2].strip(), self_us*1e-6, cumulative_us*1e-6))
+
+    return imports
+
+
+def measure(module):
+    """
+    Import a module in a fresh interpreter
+
+    Returns:
+        tuple (float, list): The cumulative import time of the module (s)
+            and all imports (see parse_importtime)
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             'import {}'.format(module)],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    imports = parse_importtime(result.stderr)
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines()
+                  if not line.startswith('import time:')]
+        raise ImportError('Could not import {}:\n{}'.format(module,
+                                                            '\n'.join(errors)))
+
+    total = [cumulative for name, _, cumulative in imports
+             if name == module]
+
+    return total[-1], imports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Check the import time of modules against a budget.')
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET,
+                        help='Maximal import time per module (s)')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Number of slowest imports to list')
+    args = parser.parse_args(argv)
+
+    over_budget = []
+    for module in args.modules:
+        try:
+            total, imports = measure(module)
+        except ImportError as e:
+            print(e)
+            over_budget.append(module)
+            continue
+        status = 'OK' if total <= args.budget else 'OVER BUDGET'
+        print('{}: {:.3f} s ({})'.format(module, total, status))
+
+        slowest = sorted(imports, key=lambda imp: imp[1], reverse=True)
+        for name, self_time, _ in slowest[:args.top]:
+            print('    {:8.3f} s  {}'.format(self_time, name))
+
+        if total > args.budget:
+            over_budget.append(module)
+
+    return 1 if over_budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,184 @@
+# Module file for declarative instrument configuration.
+# A configuration is a dict of parameter name: desired value. Only the
+# settings that differ from the last known state of the instrument (the
+# parameter cache) are sent, and ZI UHF-LI node writes are batched into a
+# single set transaction followed by a single sync.
+#
+# NB: the comparison is against the QCoDeS parameter cache. If an instrument
+# has been changed behind QCoDeS' back (front panel, file upload, reset,
+# ...), call invalidate_settings (or pass force=True) to write everything.
+
+import logging
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# The device nodes of the ZI UHF-LI parameters we configure, relative to
+# /<device>/. Parameters not in here are set one by one via the driver.
+ZI_NODES = {'oscillator1_freq': 'oscs/0/freq',
+            'demod1_order': 'demods/0/order',
+            'demod1_timeconstant': 'demods/0/timeconstant',
+            'signal_output1_on': 'sigouts/0/on',
+            'scope_samplingrate': 'scopes/0/time',
+            'scope_length': 'scopes/0/length',
+            'scope_channels': 'scopes/0/channel',
+            'scope_channel1_input': 'scopes/0/channels/0/inputselect',
+            'scope_channel2_input': 'scopes/0/channels/1/inputselect',
+            'scope_trig_enable': 'scopes/0/trigenable',
+            'scope_trig_signal': 'scopes/0/trigchannel',
+            'scope_trig_slope': 'scopes/0/trigslope',
+            'scope_trig_level': 'scopes/0/triglevel',
+            'scope_trig_hystmode': 'scopes/0/trighysteresis/mode',
+            'scope_trig_hystabsolute': 'scopes/0/trighysteresis/absolute',
+            'scope_trig_gating_enable': 'scopes/0/triggate/enable',
+            'scope_trig_holdoffmode': 'scopes/0/trigholdoffmode',
+            'scope_trig_holdoffseconds': 'scopes/0/trigholdoff',
+            'scope_trig_reference': 'scopes/0/trigreference',
+            'scope_trig_delay': 'scopes/0/trigdelay',
+            'scope_segments': 'scopes/0/segments/enable',
+            'scope_segments_count': 'scopes/0/segments/count'}
+
+# ZI parameters that are always set via the driver, since its setter keeps
+# other parameters (scope_duration, the holdoff mode) in step with them
+ZI_DRIVER_ONLY = ('scope_length', 'scope_samplingrate',
+                  'scope_trig_holdoffseconds')
+
+
+def _is_zi(instrument):
+    return hasattr(instrument, 'daq') and hasattr(instrument, 'device')
+
+
+def _is_current(param, value):
+    """
+    Whether the cached value of a parameter equals the desired value
+    """
+    latest = param.get_latest()
+
+    if latest is None:
+        return False
+    if isinstance(value, str) or isinstance(latest, str):
+        return latest == value
+
+    return bool(np.isclose(latest, value, rtol=1e-9, atol=0))
+
+
+def _raw_value(param, value):
+    """
+    The value as sent to the instrument, i.e. validated and passed through
+    the input parser of the parameter's set command (which does the value
+    mapping and set parsing of a StandardParameter). Returns None if the
+    raw value can not be worked out without calling the driver.
+    """
+    # the same validation as param.set
+    param.validate(value)
+
+    set_cmd = getattr(param, '_set', None)
+    input_parser = getattr(set_cmd, 'input_parser', None)
+    if callable(input_parser):
+        value = input_parser(value)
+
+    if isinstance(value, str):
+        return None
+
+    return value
+
+
+def _zi_send_batch(zi, batch):
+    """
+    Write a list of (param, value, node, raw) in one daq.set transaction
+    and update the parameter cache
+    """
+    if not batch:
+        return
+    zi.daq.set([(node, raw) for (_, _, node, raw) in batch])
+    for param, value, _, _ in batch:
+        param._save_val(value)
+    # the scope must be rebuilt after a scope setting has changed
+    if (hasattr(zi, 'scope_correctly_built') and
+            any(node.split('/')[2] == 'scopes'
+                for _, _, node, _ in batch)):
+        zi.scope_correctly_built = False
+
+
+def zi_set_batch(zi, settings, sync=True):
+    """
+    Set several ZI UHF-LI parameters in as few daq.set transactions as
+    possible.
+
+    Parameters that can not be expressed as a node/value pair, or whose
+    driver setter does more than a node write (ZI_DRIVER_ONLY), are set
+    via the driver. The order of the settings is kept: consecutive node
+    writes go out as one transaction.
+
+    Args:
+        zi (ZIUHFLI): QCoDeS instrument instance
+        settings (dict): parameter name: value. The order is kept.
+        sync (bool): Whether to sync once after the transactions.
+    """
+    batch = []
+    for name, value in settings.items():
+        param = zi.parameters[name]
+        raw = None
+        if name in ZI_NODES and name not in ZI_DRIVER_ONLY:
+            raw = _raw_value(param, value)
+        if raw is None:
+            _zi_send_batch(zi, batch)
+            batch = []
+            param.set(value)
+        else:
+            node = '/{}/{}'.format(zi.device, ZI_NODES[name])
+            batch.append((param, value, node, raw))
+    _zi_send_batch(zi, batch)
+
+    if sync and settings:
+        zi.daq.sync()
+
+
+def apply_settings(instrument, settings, force=False):
+    """
+    Bring an instrument into the desired configuration, writing only the
+    settings that differ from the last known state.
+
+    Args:
+        instrument (Instrument): The QCoDeS instrument
+        settings (dict): parameter name: desired value. The order is kept,
+            so put settings that other settings depend on first.
+        force (bool): If True, write all settings regardless of the cache.
+
+    Returns:
+        dict: The settings that were actually written
+    """
+    changed = {}
+    for name, value in settings.items():
+        try:
+            param = instrument.parameters[name]
+        except KeyError:
+            raise KeyError('{} has no parameter {}'.format(instrument.name,
+                                                           name))
+        if force or not _is_current(param, value):
+            changed[name] = value
+
+    log.debug('{}: {} of {} settings changed'.format(
+        instrument.name, len(changed), len(settings)))
+
+    if _is_zi(instrument):
+        zi_set_batch(instrument, changed)
+    else:
+        for name, value in changed.items():
+            instrument.parameters[name].set(value)
+
+    return changed
+
+
+def invalidate_settings(instrument):
+    """
+    Forget the last known state of an instrument, so that the next
+    apply_settings writes every setting. Call this after anything that
+    changes the instrument behind QCoDeS' back, e.g. an .awg file upload,
+    a reset or the front panel.
+    """
+    for param in instrument.parameters.values():
+        if hasattr(param, '_latest_value'):
+            param._latest_value = None
+            param._latest_ts = None
@@ -0,0 +1,139 @@
+# Module file for driving fast axes with the Keysight 33500B generators.
+# A FastRamp is a sawtooth on one channel of one generator. Any channel
+# of any of the generators can drive a fast axis, and two channels of
+# the same generator can drive two axes at once (e.g. a 2D raster).
+
+import qcodes as qc
+
+from modules.Majorana.instrument_config import apply_settings
+
+KEYSIGHT_GENERATORS = ('keysight_gen_left', 'keysight_gen_mid',
+                       'keysight_gen_right')
+
+
+class FastRamp:
+    """
+    A sawtooth ramp on a single channel of a Keysight 33500B.
+
+    Args:
+        generator (Union[str, Keysight_33500B]): The generator or its name
+            in the default station
+        channel (int): The generator channel (1 or 2)
+    """
+
+    def __init__(self, generator, channel):
+
+        if isinstance(generator, str):
+            if generator not in KEYSIGHT_GENERATORS:
+                raise ValueError('Unknown generator {}. Must be one of '
+                                 '{}.'.format(generator,
+                                              KEYSIGHT_GENERATORS))
+            generator = qc.Station.default[generator]
+
+        if channel not in [1, 2]:
+            raise ValueError('Channel must be 1 or 2')
+
+        self.keysight = generator
+        self.channel = channel
+
+    def __repr__(self):
+        return 'FastRamp({}, ch{})'.format(self.keysight.name, self.channel)
+
+    def parameter_name(self, name):
+        """
+        The name of a channel parameter, e.g. 'frequency' -> 'ch2_frequency'
+        """
+        return 'ch{}_{}'.format(self.channel, name)
+
+    def settings(self, amplitude, offset, frequency, symmetry=100,
+                 phase=None):
+        """
+        The settings for a continuous sawtooth
+
+        Args:
+            amplitude (float): Peak-to-peak amplitude (V)
+            offset (float): Offset (V)
+            frequency (float): Frequency (Hz)
+            symmetry (float): Ramp symmetry (%)
+            phase (Optional[float]): Phase (deg)
+
+        Returns:
+            dict: parameter name: value, ready for apply_settings
+        """
+        settings = {self.parameter_name('function_type'): 'RAMP',
+                    self.parameter_name('ramp_symmetry'): symmetry,
+                    self.parameter_name('amplitude_unit'): 'VPP',
+                    self.parameter_name('amplitude'): amplitude,
+                    self.parameter_name('offset'): offset,
+                    self.parameter_name('frequency'): frequency}
+        if phase is not None:
+            settings[self.parameter_name('phase')] = phase
+
+        return settings
+
+    def burst_settings(self, ncycles=1, phase=180, source='EXT',
+                       slope='POS', delay=0):
+        """
+        The settings for triggered bursts of the sawtooth
+
+        Args:
+            ncycles (int): Number of cycles per trigger
+            phase (float): Burst phase (deg)
+            source (str): Trigger source
+            slope (str): Trigger slope
+            delay (float): Trigger delay (s)
+
+        Returns:
+            dict: parameter name: value, ready for apply_settings
+        """
+        return {self.parameter_name('trigger_source'): source,
+                self.parameter_name('trigger_delay'): delay,
+                self.parameter_name('trigger_slope'): slope,
+                self.parameter_name('burst_mode'): 'N Cycle',
+                self.parameter_name('burst_ncycles'): ncycles,
+                self.parameter_name('burst_phase'): phase,
+                self.parameter_name('burst_state'): 'ON'}
+
+    def configure(self, amplitude, offset, frequency, symmetry=100,
+                  phase=None):
+        """
+        Configure the channel as a continuous sawtooth.
+        See settings for the arguments.
+        """
+        apply_settings(self.keysight, self.settings(amplitude, offset,
+                                                    frequency, symmetry,
+                                                    phase))
+
+    def output(self, state):
+        """
+        Switch the channel output 'ON' or 'OFF'
+        """
+        self.keysight.parameters[self.parameter_name('output')].set(state)
+
+
+def configure_fast_ramps(ramps, sync_ramp=None):
+    """
+    Configure several fast ramps at once, e.g. X on ch1 and Y on ch2.
+
+    The settings of ramps sharing a generator go out together, and the
+    channels of a generator driving more than one ramp are phase
+    synchronised afterwards so that the axes stay locked.
+
+    Args:
+        ramps (dict): FastRamp: settings dict (from FastRamp.settings)
+        sync_ramp (Optional[FastRamp]): The ramp whose channel drives the
+            sync output of its generator
+    """
+    by_generator = {}
+    for ramp, settings in ramps.items():
+        by_generator.setdefault(ramp.keysight, {}).update(settings)
+
+    if sync_ramp is not None:
+        by_generator[sync_ramp.keysight]['sync_source'] = sync_ramp.channel
+
+    for keysight, settings in by_generator.items():
+        apply_settings(keysight, settings)
+
+    for keysight in by_generator:
+        if len([ramp for ramp in ramps if ramp.keysight is keysight]) > 1:
+            keysight.write('PHASe:SYNChronize')
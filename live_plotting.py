@@ -0,0 +1,245 @@
+# Module file for live plotting decoupled from the acquisition loop.
+# The acquisition runs in a worker thread and writes into the DataSet's
+# arrays as usual; the main thread reads those very same arrays (no copy),
+# decimates them to screen resolution and redraws at a capped frame rate.
+# matplotlib is not thread-safe, so all drawing stays in the main thread.
+# Ctrl-C (or a failing redraw) sets a halt event, which a check_halt task
+# in the loop turns into an AcquisitionHalted, stopping the acquisition.
+
+import threading
+import time
+
+import numpy as np
+
+
+class AcquisitionHalted(Exception):
+    """
+    Raised inside an acquisition to stop it (see check_halt)
+    """
+    pass
+
+
+def check_halt(halt):
+    """
+    A loop task (qc.Task(check_halt, halt)) stopping the loop once the
+    halt event is set
+
+    Args:
+        halt (threading.Event): The event, set by LivePlot.run
+    """
+    if halt.is_set():
+        raise AcquisitionHalted('Acquisition halted')
+
+
+def minmax_decimate(y, n_bins):
+    """
+    Min/max decimation of a 1D array to (at most) 2*n_bins points.
+
+    Each bin is represented by its minimum and maximum, so that spikes and
+    steps survive the decimation (unlike plain striding).
+
+    Args:
+        y (np.ndarray): The array to decimate. NaNs (not yet measured points)
+            are ignored.
+        n_bins (int): The number of bins, i.e. roughly the number of
+            horizontal pixels available.
+
+    Returns:
+        tuple (np.ndarray, np.ndarray): The indices (as floats, i.e. x-values
+            in units of the original index) and the decimated values
+    """
+    y = np.asarray(y, dtype=float)
+    npts = len(y)
+
+    if npts <= 2*n_bins:
+        return np.arange(npts, dtype=float), y
+
+    binsize = npts // n_bins
+    usable = binsize*n_bins
+    binned = y[:usable].reshape(n_bins, binsize)
+
+    with np.errstate(invalid='ignore'):
+        mins = np.nanmin(binned, axis=1)
+        maxs = np.nanmax(binned, axis=1)
+
+    xs = np.repeat(np.arange(n_bins)*binsize + binsize/2, 2)
+    ys = np.empty(2*n_bins)
+    ys[0::2] = mins
+    ys[1::2] = maxs
+
+    return xs, ys
+
+
+def minmax_decimate_2d(z, n_rows, n_cols):
+    """
+    Decimation of a 2D array for image display. Along the inner axis we
+    keep the value with the largest magnitude deviation in each bin (the
+    2D analogue of min/max decimation), along the outer axis we stride.
+
+    Args:
+        z (np.ndarray): The 2D array (outer, inner)
+        n_rows (int): Max. number of rows to display
+        n_cols (int): Max. number of columns to display
+
+    Returns:
+        np.ndarray: The decimated array
+    """
+    z = np.asarray(z, dtype=float)
+
+    rowstep = max(1, z.shape[0] // n_rows)
+    z = z[::rowstep]
+
+    binsize = z.shape[1] // n_cols
+    if binsize < 2:
+        return z
+
+    usable = binsize*n_cols
+    binned = z[:, :usable].reshape(z.shape[0], n_cols, binsize)
+
+    with np.errstate(invalid='ignore'):
+        mins = np.nanmin(binned, axis=2)
+        maxs = np.nanmax(binned, axis=2)
+        means = np.nanmean(binned, axis=2)
+
+    return np.where(np.abs(maxs-means) > np.abs(mins-means), maxs, mins)
+
+
+class LivePlot:
+    """
+    A live plot of one or more DataArrays, refreshed while the acquisition
+    runs in a worker thread (see run).
+
+    The plotter never touches the acquisition; it only reads the arrays
+    that the Loop is filling (a shared-memory view, no copy is made until
+    decimation). The cost of a redraw is set by the screen resolution and
+    the frame rate cap, not by the size of the dataset.
+
+    Args:
+        data (DataSet): The (live) dataset to plot from
+        array_ids (list): The array_ids of the measured arrays to plot
+        max_fps (float): The maximal refresh rate (frames/s)
+        screen_points (int): The horizontal resolution to decimate to
+    """
+
+    def __init__(self, data, array_ids, max_fps=5, screen_points=800):
+
+        # imported here to keep matplotlib out of the acquisition imports
+        import matplotlib.pyplot as plt
+
+        self.data = data
+        self.array_ids = array_ids
+        self.min_interval = 1/max_fps
+        self.screen_points = screen_points
+
+        self.fig, axes = plt.subplots(1, len(array_ids), squeeze=False)
+        self.axes = axes[0]
+        self._artists = {}
+
+        self.frames_drawn = 0
+
+    def _draw_1d(self, ax, array_id, arr):
+        xs, ys = minmax_decimate(arr.ndarray, self.screen_points)
+        setpoints = np.asarray(arr.set_arrays[0].ndarray, dtype=float)
+        # map decimated indices back onto the setpoint axis
+        xs = np.interp(xs, np.arange(len(setpoints)), setpoints)
+
+        if array_id not in self._artists:
+            self._artists[array_id], = ax.plot(xs, ys)
+            ax.set_xlabel(arr.set_arrays[0].label or arr.set_arrays[0].name)
+            ax.set_ylabel(arr.label or arr.name)
+        else:
+            self._artists[array_id].set_data(xs, ys)
+            ax.relim()
+            ax.autoscale_view()
+
+    def _draw_2d(self, ax, array_id, arr):
+        z = minmax_decimate_2d(arr.ndarray, self.screen_points,
+                               self.screen_points)
+        outer = np.asarray(arr.set_arrays[0].ndarray, dtype=float)
+        inner = np.asarray(arr.set_arrays[1].ndarray, dtype=float)
+        inner = inner[np.isfinite(inner).any(axis=1)]
+        extent = [np.nanmin(inner), np.nanmax(inner),
+                  np.nanmin(outer), np.nanmax(outer)]
+
+        if array_id not in self._artists:
+            self._artists[array_id] = ax.imshow(z, aspect='auto',
+                                                origin='lower',
+                                                extent=extent)
+            ax.set_title(arr.label or arr.name)
+        else:
+            self._artists[array_id].set_data(z)
+            self._artists[array_id].set_extent(extent)
+            self._artists[array_id].autoscale()
+
+    def update(self):
+        """
+        Redraw once. Safe to call while the Loop is running.
+        """
+        for ax, array_id in zip(self.axes, self.array_ids):
+            arr = self.data.arrays[array_id]
+            if not np.isfinite(arr.ndarray).any():
+                continue
+            if arr.ndarray.ndim == 1:
+                self._draw_1d(ax, array_id, arr)
+            else:
+                self._draw_2d(ax, array_id, arr)
+
+        self.fig.canvas.draw_idle()
+        self.frames_drawn += 1
+
+    def run(self, acquire, halt=None):
+        """
+        Run an acquisition (e.g. loop.run) in a worker thread and refresh
+        the plot from the calling thread until it has finished. The GUI
+        events are processed while waiting for the next frame.
+
+        On Ctrl-C, or any other exception while drawing, the halt event is
+        set, the acquisition is waited for and the exception re-raised.
+
+        Args:
+            acquire (callable): The acquisition, called without arguments
+            halt (Optional[threading.Event]): The event the acquisition
+                checks to stop early (see check_halt)
+
+        Returns:
+            The return value of acquire. Its exceptions are re-raised here.
+        """
+        import matplotlib.pyplot as plt
+
+        if halt is None:
+            halt = threading.Event()
+        outcome = {}
+
+        def worker():
+            try:
+                outcome['result'] = acquire()
+            except Exception as e:
+                outcome['error'] = e
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+
+        try:
+            while thread.is_alive():
+                t_start = time.perf_counter()
+                try:
+                    self.update()
+                except (ValueError, IndexError):
+                    # The arrays may be half-filled or not yet allocated;
+                    # just try again on the next frame
+                    pass
+                elapsed = time.perf_counter() - t_start
+                plt.pause(max(self.min_interval - elapsed, 0.001))
+        except BaseException:
+            # stop the instruments before giving up on the plot
+            halt.set()
+            thread.join()
+            raise
+
+        thread.join()
+        # the final frame
+        self.update()
+
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome.get('result')
@@ -1,18 +1,35 @@
 from time import sleep
-from functools import partial
-
-from qcodes.instrument_drivers.devices import VoltageDivider
-
-from qcodes.instrument.parameter import ManualParameter
-from qcodes.instrument.parameter import StandardParameter
-from qcodes.utils.validators import Enum
 
 import re
 
 import logging
 import os
+import threading
 logging.basicConfig(filename=os.path.join(os.getcwd(), 'pythonlog.txt'), level=logging.DEBUG)
-from qcodes.utils.wrappers import _plot_setup, _save_individual_plots, do1d, do2d
+
+from modules.Majorana.live_plotting import LivePlot, check_halt
+from modules.Majorana.settling import sweep_settle_time
+from modules.Majorana.value_cache import value_cache
+
+# qcodes is imported on first use below, so that importing this module
+# (and reload_settings) stays fast
+
+
+def do1d(*args, **kwargs):
+    """
+    qcodes.utils.wrappers.do1d, imported on first use
+    """
+    from qcodes.utils.wrappers import do1d as _do1d
+    return _do1d(*args, **kwargs)
+
+
+def do2d(*args, **kwargs):
+    """
+    qcodes.utils.wrappers.do2d, imported on first use
+    """
+    from qcodes.utils.wrappers import do2d as _do2d
+    return _do2d(*args, **kwargs)
+
 
 ##################################################
 # Helper functions and wrappers
@@ -48,6 +65,8 @@ def _unassign_qdac_slope(sweep_parameter):
     a VoltageDivider instance.
     """
 
+    from qcodes.instrument_drivers.devices import VoltageDivider
+
     paramclass = str(sweep_parameter._instrument.__class__) 
 
     if not paramclass == "<class 'qcodes.instrument_drivers.QDev.QDac.QDac'>":
@@ -101,13 +120,14 @@ def prepare_qdac(qdac_channel, start, stop, n_points, delay, ramp_slope):
     slope_parameter = qdac.parameters['ch{0:02d}_slope'.format(channel_id)]
     slope_parameter(ramp_slope)
 
+    cache = value_cache()
     try:
-        init_ramp_time = abs(start-qdac_channel.get())/ramp_slope
+        init_ramp_time = abs(start-cache.get(qdac_channel))/ramp_slope
     except TypeError:
         init_ramp_time = 0
 
-    qdac_channel.set(start)
-    time.sleep(init_ramp_time)
+    cache.set(qdac_channel, start)
+    sleep(init_ramp_time)
 
     try:
         additional_delay_perPoint = (abs(stop-start)/n_points)/ramp_slope
@@ -124,7 +144,8 @@ def do1d_M(inst_set, start, stop, n_points, delay, *inst_meas, ramp_slope=None):
         start:  Start of sweep
         stop:  End of sweep
         division:  Spacing between values
-        delay:  Delay at every step
+        delay:  Delay at every step. 'auto' computes the settle time of
+            a step (see settling.py)
         *inst_meas:  any number of instrument to measure
         ramp_slope: 
 
@@ -132,6 +153,10 @@ def do1d_M(inst_set, start, stop, n_points, delay, *inst_meas, ramp_slope=None):
         plot, data : returns the plot and the dataset
 
     """
+    if delay == 'auto':
+        delay = sweep_settle_time(inst_set, start, stop, n_points,
+                                  inst_meas)
+
     if str(inst_set._instrument.__class__) == "<class 'qcodes.instrument_drivers.QDev.QDac.QDac'>":
         channel_id = int(re.findall('\d+', inst_set.name)[0])
         ramp_qdac(channel_id, start, ramp_slope)
@@ -150,18 +175,29 @@ def do2d_M(inst_set, start, stop, n_points, delay, inst_set2, start2, stop2,
         start:  Start of sweep
         stop:  End of sweep
         division:  Spacing between values
-        delay:  Delay at every step
+        delay:  Delay at every step. 'auto' computes the settle time of
+            a step, including the jump back of the second instrument
+            (see settling.py)
         inst_set_2:  Second instrument to sweep over
         start_2:  Start of sweep for second intrument
         stop_2:  End of sweep for second intrument
         division_2:  Spacing between values for second intrument
-        delay_2:  Delay at every step for second intrument
+        delay_2:  Delay at every step for second intrument. May be 'auto'.
         *inst_meas:
         ramp_slope:
 
     Returns:
         plot, data : returns the plot and the dataset
     """
+    if delay == 'auto':
+        delay = max(sweep_settle_time(inst_set, start, stop, n_points,
+                                      inst_meas),
+                    sweep_settle_time(inst_set2, start2, stop2, n_points2,
+                                      inst_meas, step=abs(stop2-start2)))
+    if delay2 == 'auto':
+        delay2 = sweep_settle_time(inst_set2, start2, stop2, n_points2,
+                                   inst_meas)
+
 
     if str(inst_set2._instrument.__class__) == "<class 'qcodes.instrument_drivers.QDev.QDac.QDac'>":
         channel_id = int(re.findall('\d+', inst_set2.name)[0])
@@ -180,6 +216,93 @@ def do2d_M(inst_set, start, stop, n_points, delay, inst_set2, start2, stop2,
 
     return plot, data
 
+def _run_live(loop, halt, inst_meas, max_fps, screen_points):
+    """
+    Run a loop in a worker thread with a LivePlot refreshing in the main
+    thread, instead of the per-point plot updates of _do_measurement. The
+    full resolution plots are only made once, after the loop has finished.
+    The loop must check the halt event (see live_plotting.check_halt), so
+    that Ctrl-C stops it.
+    """
+    from qcodes.utils.wrappers import _save_individual_plots
+
+    data = loop.get_data_set()
+    array_ids = [array_id for array_id, arr in data.arrays.items()
+                 if not arr.is_setpoint]
+
+    live = LivePlot(data, array_ids, max_fps=max_fps,
+                    screen_points=screen_points)
+    live.run(loop.run, halt=halt)
+
+    _save_individual_plots(data, inst_meas)
+
+    return live, data
+
+
+def do1d_live(inst_set, start, stop, n_points, delay, *inst_meas,
+              max_fps=5, screen_points=800):
+    """
+    Like do1d, but with a decimated live plot that does not slow down
+    the acquisition.
+
+    Args:
+        inst_set:  Instrument to sweep over
+        start:  Start of sweep
+        stop:  End of sweep
+        n_points:  Number of points in the sweep
+        delay:  Delay at every step
+        *inst_meas:  any number of instrument to measure
+        max_fps: Maximal refresh rate of the live plot (frames/s)
+        screen_points: Resolution that the live plot decimates to
+
+    Returns:
+        plot, data : returns the live plot and the dataset
+    """
+    import qcodes as qc
+
+    halt = threading.Event()
+    loop = qc.Loop(inst_set.sweep(start, stop, num=n_points),
+                   delay).each(*inst_meas, qc.Task(check_halt, halt))
+
+    return _run_live(loop, halt, inst_meas, max_fps, screen_points)
+
+
+def do2d_live(inst_set, start, stop, n_points, delay, inst_set2, start2,
+              stop2, n_points2, delay2, *inst_meas,
+              max_fps=5, screen_points=800):
+    """
+    Like do2d, but with a decimated live plot that does not slow down
+    the acquisition.
+
+    Args:
+        inst_set:  Instrument to sweep over
+        start:  Start of sweep
+        stop:  End of sweep
+        n_points:  Number of points in the sweep
+        delay:  Delay at every step
+        inst_set2:  Second instrument to sweep over
+        start2:  Start of sweep for second intrument
+        stop2:  End of sweep for second intrument
+        n_points2:  Number of points in the sweep for second intrument
+        delay2:  Delay at every step for second intrument
+        *inst_meas:  any number of instrument to measure
+        max_fps: Maximal refresh rate of the live plot (frames/s)
+        screen_points: Resolution that the live plot decimates to
+
+    Returns:
+        plot, data : returns the live plot and the dataset
+    """
+    import qcodes as qc
+
+    halt = threading.Event()
+    innerloop = qc.Loop(inst_set2.sweep(start2, stop2, num=n_points2),
+                        delay2).each(*inst_meas, qc.Task(check_halt, halt))
+    outerloop = qc.Loop(inst_set.sweep(start, stop, num=n_points),
+                        delay).each(innerloop)
+
+    return _run_live(outerloop, halt, inst_meas, max_fps, screen_points)
+
+
 def ramp_qdac(chan, target_voltage, slope=None):
     """
     Ramp a qdac channel. Blocking.
@@ -198,12 +321,14 @@ def ramp_qdac(chan, target_voltage, slope=None):
             raise ValueError('No slope found in QDAC_SLOPES. '
                              'Please provide a slope!')
 
+    cache = value_cache()
+    voltage = qdac.parameters['ch{:02}_v'.format(chan)]
+
     # Make the ramp blocking, so that we may unassign the slope
-    ramp_time = abs(qdac.parameters['ch{:02}_v'.format(chan)].get() -
-                    target_voltage)/slope + 0.03
+    ramp_time = abs(cache.get(voltage) - target_voltage)/slope + 0.03
 
     qdac.parameters['ch{:02}_slope'.format(chan)].set(slope)
-    qdac.parameters['ch{:02}_v'.format(chan)].set(target_voltage)
+    cache.set(voltage, target_voltage)
     sleep(ramp_time)
     qdac.parameters['ch{:02}_slope'.format(chan)].set('Inf')
 
@@ -0,0 +1,133 @@
+# Module file for the description of a pulsed experiment.
+# A PulsedExperimentSpec holds everything about a pulsed run except the
+# instruments. It is validated once, immutable, hashable and serialisable
+# to JSON, so the same object drives the setup, the sequence generation
+# and the visualisation, and anything derived from it can be memoized.
+
+from collections import namedtuple
+import json
+
+from modules.Majorana.zi_timing import solve_timing
+
+_FIELDS = (('fast_axis', str),
+           ('slow_axis', str),
+           ('slow_start', float),
+           ('slow_stop', float),
+           ('slow_npts', int),
+           ('fast_start', float),
+           ('fast_stop', float),
+           ('fast_npts', int),
+           # Acquisition variables
+           ('n_avgs', int),
+           ('pts_per_shot', int),
+           # Pulse variables
+           ('hightime', float),
+           ('meastime', float),
+           ('cycletime', float),
+           ('transfertime', float),
+           ('pulsehigh', float),
+           ('trig_delay', float),
+           # Demodulation variables
+           ('demod_freq', float),
+           # AWG setting
+           ('awg_channel', int))
+
+
+class PulsedExperimentSpec(namedtuple('PulsedExperimentSpec',
+                                      [name for name, _ in _FIELDS])):
+    """
+    The full description of a pulsed experiment (see doPulsedExperiment
+    for the meaning of the fields). All fields must be given as keyword
+    arguments.
+    """
+
+    __slots__ = ()
+
+    FAST_AXES = ('ramp',)
+    SLOW_AXES = ('dt', 'amp')  # TODO: maybe even DC
+    SR = 1e9  # The AWG sample rate. Hidden from the experimentalists.
+    ZI_TRIGGER_HOLDOFF = 60e-6  # (s)
+    ZI_TRIGGER_DELAY = 1e-6  # (s)
+
+    def __new__(cls, **kwargs):
+
+        given = set(kwargs.keys())
+        needed = set(cls._fields)
+        if given != needed:
+            raise ValueError('Unspecified arguments: {}. Unknown arguments: '
+                             '{}.'.format(needed.difference(given),
+                                          given.difference(needed)))
+
+        values = {name: kind(kwargs[name]) for name, kind in _FIELDS}
+        # int() would silently truncate, e.g. 2.7 points to 2
+        for name, kind in _FIELDS:
+            if kind is int and values[name] != kwargs[name]:
+                raise ValueError('{} must be an integer, '
+                                 'got {}.'.format(name, kwargs[name]))
+        spec = super().__new__(cls, **values)
+        spec.validate()
+
+        return spec
+
+    def validate(self):
+        """
+        Raise if the spec does not describe a possible experiment
+        """
+        if self.fast_axis not in self.FAST_AXES:
+            raise NotImplementedError('Fast axis specifier '
+                                      'must be in {}.'.format(self.FAST_AXES))
+        if self.slow_axis not in self.SLOW_AXES:
+            raise NotImplementedError('Slow axis specifier '
+                                      'must be in {}.'.format(self.SLOW_AXES))
+
+        if self.cycletime < 200e-6:
+            raise ValueError('Cycle time too low. Must be at least 200 mu s')
+        if self.transfertime < 150e-3:
+            raise ValueError('Transfer time too low. Must be at least 150 '
+                             'ms.')
+        for name in ['slow_npts', 'fast_npts', 'n_avgs', 'pts_per_shot']:
+            if getattr(self, name) < 1:
+                raise ValueError('{} must be positive.'.format(name))
+        if self.awg_channel not in [1, 2, 3, 4]:
+            raise ValueError('AWG channel must be 1, 2, 3 or 4.')
+        if self.pulsehigh <= 0:
+            raise ValueError('Pulse amplitude must be positive.')
+        # the ZI must be ready for the next trigger within one cycle
+        min_cycletime = self.timing().awg_cycletime
+        if self.cycletime < min_cycletime:
+            raise ValueError('Cycle time too low for the measurement time. '
+                             'Must be at least {} s.'.format(min_cycletime))
+        # the longest pulse and the measurement must fit in one cycle
+        hightimes = [self.hightime]
+        if self.slow_axis == 'dt':
+            hightimes += [self.slow_start, self.slow_stop]
+        if min(hightimes) <= 0:
+            raise ValueError('Pulse width must be positive.')
+        if max(hightimes) + self.timing().scope_duration >= self.cycletime:
+            raise ValueError('Pulse width {} s too long. Pulse and '
+                             'measurement must fit in the cycle time '
+                             '({} s).'.format(max(hightimes), self.cycletime))
+
+    def __reduce__(self):
+        # __new__ only takes keyword arguments
+        return (self.__class__.from_json, (self.to_json(),))
+
+    def timing(self):
+        """
+        The ZI scope timing realising the measurement time with at most
+        pts_per_shot points per pulse (cached). Its scope_duration is the
+        measurement time actually realised.
+
+        Returns:
+            FastTiming: see zi_timing.solve_timing
+        """
+        return solve_timing(self.meastime, self.ZI_TRIGGER_HOLDOFF,
+                            self.ZI_TRIGGER_DELAY, self.fast_npts,
+                            self.pts_per_shot)
+
+    def to_json(self):
+        return json.dumps(self._asdict(), sort_keys=True)
+
+    @classmethod
+    def from_json(cls, string):
+        return cls(**json.loads(string))
@@ -1,18 +1,35 @@
 import logging
-import qcodes as qc
-from qcodes.utils.validators import Numbers
 
-from qcodes.utils.configreader import Config
+from modules.Majorana.value_cache import value_cache
 
 log = logging.getLogger(__name__)
 
 
+# qcodes is imported on first use, so that importing this module is fast
+
+
+def _config():
+    """
+    The default Config object
+    """
+    from qcodes.utils.configreader import Config
+    return Config.default
+
+
+def _station():
+    """
+    The default Station
+    """
+    import qcodes as qc
+    return qc.Station.default
+
+
 def bias_channels():
     """
     A convenience function returning a list of bias channels.
     """
 
-    configs = Config.default
+    configs = _config()
     configs.reload()
 
     bias_chan1 = configs.get('Channel Parameters', 'topo bias channel')
@@ -27,7 +44,7 @@ def used_channels():
     Return a list of currently labelled channels as ints.
     """
 
-    configs = Config.default
+    configs = _config()
     configs.reload()
 
     l_chs = configs.get('QDac Channel Labels')
@@ -38,7 +55,7 @@ def used_voltage_params():
     """
     Returns a list of qdac voltage parameters for the used channels
     """
-    station = qc.Station.default
+    station = _station()
 
     qdac = station['qdac']
 
@@ -53,7 +70,7 @@ def channel_labels():
     Returns a dict of the labelled channels. Key: channel number (int),
     value: label (str)
     """
-    configs = Config.default
+    configs = _config()
     configs.reload()
 
     labs = configs.get('QDac Channel Labels')
@@ -67,13 +84,15 @@ def print_voltages_all():
     Convenience function for printing all qdac voltages
     """
 
-    station = qc.Station.default
+    station = _station()
     qdac = station['qdac']
 
     parnames = sorted([par for par in qdac.parameters.keys()
                        if par.endswith('_v')])
+    cache = value_cache()
     for parname in parnames:
-        print('{}: {} V'.format(parname, qdac.parameters[parname].get()))
+        print('{}: {} V'.format(parname,
+                                cache.get(qdac.parameters[parname])))
 
     check_unused_qdac_channels()
 
@@ -83,7 +102,7 @@ def qdac_slopes():
     Returns a dict with the QDac slopes defined in the config file
     """
 
-    configs = Config.default
+    configs = _config()
     configs.reload()
 
     qdac_slope = float(configs.get('Ramp speeds',
@@ -108,13 +127,23 @@ def check_unused_qdac_channels():
     """
     Check whether any UNASSIGNED QDac channel has a non-zero voltage
     """
-    station = qc.Station.default
+    station = _station()
 
     qdac = station['qdac']
 
-    qdac._get_status()
-    for ch in [el for el in range(1, 48) if el not in used_channels()]:
-        temp_v = qdac.parameters['ch{:02}_v'.format(ch)].get_latest()
+    cache = value_cache()
+    used = used_channels()
+    unused = [ch for ch in range(1, 48) if ch not in used]
+    params = [qdac.parameters['ch{:02}_v'.format(ch)] for ch in unused]
+
+    # one status query refreshes all channels, so only ask if any is stale
+    if not all(cache.is_fresh(param) for param in params):
+        qdac._get_status()
+        for param in params:
+            cache.record(param, param.get_latest())
+
+    for ch, param in zip(unused, params):
+        temp_v = cache.get(param)
         if temp_v > 0.0:
             log.warning('Unused qDac channel not zero: channel '
                         '{:02}: {}'.format(ch, temp_v))
@@ -126,8 +155,8 @@ def reload_DMM_settings():
     """
 
     # Get the two global objects containing the instruments and settings
-    station = qc.Station.default
-    configs = Config.default
+    station = _station()
+    configs = _config()
     configs.reload()
 
     dmm_top = station['keysight_dmm_top']
@@ -141,8 +170,8 @@ def reload_SR830_settings():
     """
 
     # Get the two global objects containing the instruments and settings
-    station = qc.Station.default
-    configs = Config.default
+    station = _station()
+    configs = _config()
     configs.reload()
 
     # one could put in some validation here if wanted
@@ -170,10 +199,12 @@ def reload_QDAC_settings():
     """
     Function to update the qdac based on the configuration file
     """
+    from qcodes.utils.validators import Numbers
+    from modules.Majorana.virtual_gates import load_virtual_gates
 
-    configs = Config.default
+    configs = _config()
     configs.reload()
-    station = qc.Station.default
+    station = _station()
 
     # Update the voltage dividers
     topo_dc = float(configs.get('Gain settings',
@@ -210,3 +241,6 @@ def reload_QDAC_settings():
     labels = channel_labels()
     for chan, label in labels.items():
         qdac.parameters['ch{:02}_v'.format(chan)].label = label
+
+    # Reload the virtual gates (they start over at the present voltages)
+    load_virtual_gates(qdac, configs)
@@ -0,0 +1,169 @@
+# Module file for bringing the sample to a safe state in a hurry.
+# panic_stop switches off every output of the station concurrently (one
+# thread per instrument, so no instrument sees two commands at once) and
+# meanwhile ramps all used QDac channels to zero in parallel: the QDac
+# ramps in hardware, so all channels are set with their slopes first and
+# we only wait for the slowest of them.
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import time
+
+from modules.Majorana.reload_settings import qdac_slopes, used_channels
+from modules.Majorana.value_cache import value_cache
+
+log = logging.getLogger(__name__)
+
+# (parameter name, safe value). Applied to every instrument having the
+# parameter.
+SAFE_OUTPUTS = (('ch1_output', 'OFF'),  # Keysight 33500B
+                ('ch2_output', 'OFF'),
+                ('sync_output', 'OFF'),
+                ('ch1_state', 0),  # AWG5014
+                ('ch2_state', 0),
+                ('ch3_state', 0),
+                ('ch4_state', 0),
+                ('signal_output1_on', 'OFF'),  # ZI UHF-LI
+                ('signal_output2_on', 'OFF'),
+                ('status', 'off'))  # R&S SGS100A
+
+# The SR830 output can not be switched off, only turned down
+SR830_MIN_AMPLITUDE = 0.004
+
+# The parameters identifying a Keithley 2600 source channel
+KEITHLEY_PARAMETERS = ('volt', 'curr', 'output')
+
+
+def _outputs_off(instrument):
+    """
+    Switch off all outputs of an instrument. Returns the time it took.
+    """
+    t_start = time.perf_counter()
+
+    # stop the AWG before touching its channels
+    if 'run_state' in instrument.parameters:
+        instrument.stop()
+
+    for name, value in SAFE_OUTPUTS:
+        if name in instrument.parameters:
+            instrument.parameters[name].set(value)
+
+    if ('time_constant' in instrument.parameters and
+            'amplitude' in instrument.parameters):
+        instrument.amplitude(SR830_MIN_AMPLITUDE)
+
+    # set the Keithley to zero (with the step and delay of its volt
+    # parameter, if any) before opening its output
+    if all(name in instrument.parameters for name in KEITHLEY_PARAMETERS):
+        instrument.volt(0)
+        instrument.output('off')
+
+    return time.perf_counter() - t_start
+
+
+def _panic_slopes():
+    """
+    The QDac slopes of the used channels. Falls back to the general QDac
+    ramp speed if the config does not describe every channel.
+    """
+    try:
+        return qdac_slopes()
+    except KeyError:
+        log.warning('Incomplete slope settings in the config. Ramping all '
+                    'channels at the general QDac ramp speed.')
+        # imported here to keep qcodes out of the import of this module
+        from qcodes.utils.configreader import Config
+        configs = Config.default
+
+        slope = float(configs.get('Ramp speeds', 'max rampspeed qdac'))
+        slopes = dict.fromkeys(used_channels(), slope)
+        bias = int(configs.get('Channel Parameters', 'topo bias channel'))
+        slopes[bias] = float(configs.get('Ramp speeds',
+                                         'max rampspeed bias'))
+        return slopes
+
+
+def _ramp_qdac_to_zero(qdac):
+    """
+    Ramp all used QDac channels to zero at the same time.
+    Returns the time it took.
+    """
+    t_start = time.perf_counter()
+
+    slopes = _panic_slopes()
+    cache = value_cache()
+
+    # a single status query reads all voltages
+    qdac._get_status()
+
+    ramp_time = 0
+    for chan, slope in slopes.items():
+        voltage = qdac.parameters['ch{:02}_v'.format(chan)]
+        ramp_time = max(ramp_time, abs(voltage.get_latest())/slope)
+        qdac.parameters['ch{:02}_slope'.format(chan)].set(slope)
+        cache.set(voltage, 0)
+
+    time.sleep(ramp_time + 0.03)
+
+    for chan in slopes:
+        qdac.parameters['ch{:02}_slope'.format(chan)].set('Inf')
+
+    return time.perf_counter() - t_start
+
+
+def panic_stop(station=None):
+    """
+    Bring the sample to a safe state: all generator, AWG, lock-in, RF and
+    Keithley source outputs off and all used QDac channels at zero. Errors
+    are logged and do not stop the rest of the shutdown.
+
+    Only connected instruments are touched; connecting the rest would cost
+    seconds each. The instruments of a LazyStation that are not connected
+    yet are listed as not checked, check them by hand.
+
+    Args:
+        station (Optional[Station]): The station. Defaults to the default
+            station.
+
+    Returns:
+        dict: 'total' (s), the time per instrument (s), 'failures'
+            (instrument name: exception) and 'not checked' (names of the
+            instruments that are not connected)
+    """
+    t_start = time.perf_counter()
+
+    if station is None:
+        import qcodes as qc
+        station = qc.Station.default
+
+    instruments = {name: inst for name, inst in station.components.items()
+                   if hasattr(inst, 'parameters')}
+
+    report = {'failures': {},
+              'not checked': list(getattr(station, 'pending', ()))}
+
+    with ThreadPoolExecutor(max_workers=max(len(instruments), 1)) as pool:
+        futures = {}
+        for name, instrument in instruments.items():
+            if name == 'qdac':
+                futures[name] = pool.submit(_ramp_qdac_to_zero, instrument)
+            else:
+                futures[name] = pool.submit(_outputs_off, instrument)
+
+        for name, future in futures.items():
+            try:
+                report[name] = future.result()
+            except Exception as e:
+                log.exception('Panic stop failed for {}'.format(name))
+                report['failures'][name] = e
+
+    report['total'] = time.perf_counter() - t_start
+
+    print('Panic stop completed in {:.2f} s'.format(report['total']))
+    if report['failures']:
+        print('FAILED for: {}'.format(', '.join(report['failures'])))
+    if report['not checked']:
+        print('Not connected, NOT checked: {}'.format(
+            ', '.join(report['not checked'])))
+
+    return report
@@ -0,0 +1,234 @@
+# Module file for previewing broadbean sequences.
+# Sequence.plotSequence forges every element at the full AWG sample rate,
+# i.e. millions of points for a long wait. The waveforms we use are all
+# built from linear (ramp and wait) segments, so the preview is drawn
+# exactly from the element descriptions as a list of breakpoints instead:
+# a handful of points per edge, regardless of the duration.
+
+import numpy as np
+
+_LINEAR_FUNCTIONS = ('ramp', 'waituntil')
+
+
+def _function_name(segment):
+    # e.g. 'PulseAtoms.ramp' -> 'ramp'
+    return segment['function'].split('.')[-1]
+
+
+def _scalar(value):
+    # durations and wait times are stored as plain numbers or 1-tuples
+    # depending on the broadbean version
+    if isinstance(value, (list, tuple)):
+        value = value[0]
+    return float(value)
+
+
+def _blueprint_breakpoints(bp_desc):
+    """
+    The breakpoints of one blueprint (one channel of one element)
+
+    Args:
+        bp_desc (dict): The blueprint description
+
+    Returns:
+        tuple (list, list, float, list): times, values, the total duration
+            and the start time of each segment
+    """
+    segkeys = sorted(key for key in bp_desc if key.startswith('segment_'))
+
+    times = []
+    values = []
+    starts = []
+    t = 0
+    level = 0
+    for key in segkeys:
+        segment = bp_desc[key]
+        function = _function_name(segment)
+        if function not in _LINEAR_FUNCTIONS:
+            raise ValueError('Can not preview segment function {}. Use '
+                             'Sequence.plotSequence instead.'.format(function))
+
+        if function == 'waituntil':
+            # holds zero until an absolute time in the element
+            end = _scalar(segment['arguments']['waittime'])
+            start_val = stop_val = 0
+        else:
+            end = t + _scalar(segment['durations'])
+            start_val = segment['arguments']['start']
+            stop_val = segment['arguments']['stop']
+
+        if end < t:
+            raise ValueError('Segment {} ends before it starts.'.format(key))
+
+        starts.append(t)
+        times += [t, end]
+        values += [start_val, stop_val]
+        t = end
+        level = stop_val
+
+    if not times:
+        times, values = [0], [level]
+
+    return times, values, t, starts
+
+
+def _relative_markers(relative, starts):
+    """
+    Convert segment markers, one (delay, duration) per segment, to
+    absolute (start, duration) intervals
+    """
+    intervals = []
+    for (delay, width), start in zip(relative or [], starts):
+        if width > 0:
+            intervals.append((start + delay, width))
+    return intervals
+
+
+def _marker_breakpoints(intervals, duration):
+    """
+    Breakpoints of a marker given as (start, duration) intervals
+    """
+    times = [0]
+    values = [0]
+    for start, width in sorted(intervals or []):
+        start = min(start, duration)
+        stop = min(start+width, duration)
+        times += [start, start, stop, stop]
+        values += [0, 1, 1, 0]
+    times.append(duration)
+    values.append(0)
+
+    return times, values
+
+
+def element_breakpoints(element):
+    """
+    The breakpoints of all channels of an element, without forging it.
+
+    Args:
+        element (Element): A broadbean element made of ramp and waituntil
+            segments, with absolute and/or segment markers
+
+    Returns:
+        tuple (dict, float): channel: {'wfm', 'm1', 'm2'} with each value a
+            tuple of time and value arrays, and the element duration
+    """
+    desc = element.description
+
+    channels = {}
+    duration = 0
+    for chan, bp_desc in desc.items():
+        if not isinstance(bp_desc, dict) or not any(
+                key.startswith('segment_') for key in bp_desc):
+            continue
+        times, values, dur, starts = _blueprint_breakpoints(bp_desc)
+        channels[chan] = {'wfm': (times, values)}
+        channels[chan]['_markers'] = tuple(
+            list(bp_desc.get('marker{}_abs'.format(n)) or []) +
+            _relative_markers(bp_desc.get('marker{}_rel'.format(n)), starts)
+            for n in (1, 2))
+        duration = max(duration, dur)
+
+    for chan, data in channels.items():
+        marker1, marker2 = data.pop('_markers')
+        data['m1'] = _marker_breakpoints(marker1, duration)
+        data['m2'] = _marker_breakpoints(marker2, duration)
+
+    return channels, duration
+
+
+def sequence_breakpoints(seq, max_repetitions=1000):
+    """
+    The breakpoints of a whole sequence, played once from the top with
+    each element repeated its number of repetitions.
+
+    Repetitions of an element are shifted copies of its breakpoints, so
+    the cost scales with the number of edges, not with the duration. An
+    element with infinite repetitions (nreps 0, i.e. waiting for an event)
+    is drawn once, and gotos and event jumps are not followed.
+
+    Args:
+        seq (Sequence): The broadbean sequence
+        max_repetitions (int): More repetitions of an element than this
+            are drawn as a single block spanning the same time (its
+            envelope), to keep the preview light
+
+    Returns:
+        dict: channel: {'wfm', 'm1', 'm2'} with each value a tuple of
+            time and value arrays
+    """
+    positions = range(1, seq.length_sequenceelements+1)
+
+    rendered = {}
+    t0 = 0
+    for pos in positions:
+        channels, duration = element_breakpoints(seq.element(pos))
+        nreps = seq._sequencing[pos][1]
+        nreps = max(nreps, 1)
+
+        for chan, data in channels.items():
+            out = rendered.setdefault(chan, {'wfm': ([], []),
+                                             'm1': ([], []),
+                                             'm2': ([], [])})
+            for name, (times, values) in data.items():
+                times = np.asarray(times, dtype=float)
+                values = np.asarray(values, dtype=float)
+                if nreps > max_repetitions:
+                    # the envelope of the repeated element
+                    times = np.array([0, 0, nreps*duration, nreps*duration])
+                    values = np.array([values.min(), values.max(),
+                                       values.max(), values.min()])
+                    offsets = [t0]
+                else:
+                    offsets = t0 + duration*np.arange(nreps)
+                for offset in offsets:
+                    out[name][0].append(times + offset)
+                    out[name][1].append(values)
+
+        t0 += nreps*duration
+
+    for chan, data in rendered.items():
+        for name, (times, values) in data.items():
+            data[name] = (np.concatenate(times), np.concatenate(values))
+
+    return rendered
+
+
+def preview_sequence(seq, max_repetitions=1000):
+    """
+    Plot a preview of a sequence: the waveform of each channel with its
+    markers below it. Instant and light for sequences of any length.
+
+    Args:
+        seq (Sequence): The broadbean sequence
+        max_repetitions (int): See sequence_breakpoints
+
+    Returns:
+        Figure: The matplotlib figure
+    """
+    # imported here to keep matplotlib out of the acquisition imports
+    import matplotlib.pyplot as plt
+
+    rendered = sequence_breakpoints(seq, max_repetitions=max_repetitions)
+    chans = sorted(rendered.keys(), key=str)
+
+    fig, axes = plt.subplots(len(chans), 1, sharex=True, squeeze=False)
+    for ax, chan in zip(axes[:, 0], chans):
+        data = rendered[chan]
+        times, values = data['wfm']
+        ax.plot(times*1e3, values, lw=1)
+        ax.set_ylabel('Ch {} (V)'.format(chan))
+
+        # markers drawn as logic traces below the waveform
+        span = max(np.ptp(values), 1e-3)
+        base = values.min() - 0.2*span
+        for n, name in enumerate(['m1', 'm2']):
+            times, values = data[name]
+            ax.plot(times*1e3, base - (n+1)*0.3*span + 0.25*span*values,
+                    lw=1, label=name)
+        ax.legend(loc='upper right', fontsize='small')
+
+    axes[-1, 0].set_xlabel('Time (ms)')
+    fig.tight_layout()
+
+    return fig
@@ -0,0 +1,223 @@
+# Module file for the settle time after a gate step.
+# Instead of a fixed delay per point, the wait is the time it takes for
+# the three stages between the QDac and the data to settle:
+#   1: the QDac ramping the step at its slope (if a slope is assigned)
+#   2: the RC filter of the DC lines (absolute tolerance, so small steps
+#      settle faster than large ones)
+#   3: the lock-in output filter (n-pole RC, n = slope/6 dB/oct). Its
+#      tolerance is relative to the signal change over the whole sweep, so
+#      a small step, changing the signal by a fraction of that, settles
+#      faster than a large one
+# The line parameters live in the [Settling] section of the config file.
+
+from functools import lru_cache
+import math
+import re
+
+# used if the config has no [Settling] section
+DEFAULT_SETTLING = {'line rc': 0.0,
+                    'line tolerance': 1e-5,
+                    'lockin tolerance': 0.01}
+
+
+def settling_config(config=None):
+    """
+    The settling parameters of the config file, with defaults for the
+    missing ones
+
+    Args:
+        config (Optional[Config]): The config. Defaults to Config.default.
+
+    Returns:
+        dict: 'line rc' (s), 'line tolerance' (V), 'lockin tolerance'
+            (relative)
+    """
+    if config is None:
+        # imported here to keep qcodes out of the import of this module
+        from qcodes.utils.configreader import Config
+        config = Config.default
+
+    settings = DEFAULT_SETTLING.copy()
+    if config is not None:
+        try:
+            section = config.get('Settling')
+        except KeyError:
+            section = {}
+        for key in settings:
+            if key in section:
+                settings[key] = float(section[key])
+
+    return settings
+
+
+@lru_cache(maxsize=64)
+def lockin_settle_factor(filter_slope, tolerance):
+    """
+    The time (in units of the time constant) for an n-pole RC filter to
+    settle to within a relative tolerance of a step.
+
+    The step response of n identical poles is
+    1 - exp(-x) * sum_{k<n} x^k/k!, which is solved for x by bisection.
+
+    Args:
+        filter_slope (int): The filter slope (dB/oct), i.e. 6, 12, 18 or 24
+        tolerance (float): The relative tolerance
+
+    Returns:
+        float: The settle time in units of the time constant
+    """
+    npoles = max(1, int(round(filter_slope/6)))
+
+    def residual(x):
+        return math.exp(-x)*sum(x**k/math.factorial(k)
+                                for k in range(npoles))
+
+    low, high = 0.0, 1.0
+    while residual(high) > tolerance:
+        high *= 2
+    for _ in range(60):
+        mid = (low+high)/2
+        if residual(mid) > tolerance:
+            low = mid
+        else:
+            high = mid
+
+    return high
+
+
+def line_settle_time(step, rc, tolerance):
+    """
+    The time for a single-pole line filter to settle after a voltage step
+    to within an absolute tolerance (V). Zero for steps below the
+    tolerance.
+    """
+    step = abs(step)
+    if rc <= 0 or step <= tolerance:
+        return 0.0
+    return rc*math.log(step/tolerance)
+
+
+def ramp_time(step, slope):
+    """
+    The time the QDac takes to ramp a step. slope is None or 'Inf' if no
+    slope is assigned, i.e. the step is immediate.
+    """
+    if slope is None or slope == 'Inf':
+        return 0.0
+    return abs(step)/float(slope)
+
+
+def settle_time(step, slope=None, tau=None, filter_slope=24, fraction=1,
+                config=None):
+    """
+    The minimal wait after a gate step before the measured value is good.
+
+    Args:
+        step (float): The voltage step at the QDac (V)
+        slope (Optional[float]): The QDac slope (V/s), None if unassigned
+        tau (Optional[float]): The lock-in time constant (s). None if no
+            lock-in is read.
+        filter_slope (int): The lock-in filter slope (dB/oct)
+        fraction (float): The step as a fraction of the sweep range. The
+            lock-in tolerance is relative to the range, i.e. divided by it.
+        config (Optional[Config]): See settling_config
+
+    Returns:
+        float: The settle time (s)
+    """
+    settings = settling_config(config)
+
+    wait = ramp_time(step, slope)
+    wait += line_settle_time(step, settings['line rc'],
+                             settings['line tolerance'])
+    if tau is not None and fraction > 0:
+        # the residuals r of the previous steps of a sweep add up to about
+        # r/(1-r) steps, which must stay within the tolerance
+        allowed = settings['lockin tolerance']/fraction
+        wait += tau*lockin_settle_factor(filter_slope, allowed/(1+allowed))
+
+    return wait
+
+
+def qdac_step(param, step):
+    """
+    The QDac channel slope and the step at the QDac behind a set
+    parameter (which may be a VoltageDivider around a QDac channel, or a
+    virtual gate, for which the largest channel step counts)
+
+    Returns:
+        tuple (float, Optional[float]): The step (V) and the slope (V/s),
+            None if the parameter is not a QDac channel with a slope
+    """
+    if hasattr(param, 'physical_steps'):
+        # a virtual gate; the channels are set without a slope
+        return max(abs(param.physical_steps(step))), None
+
+    if hasattr(param, 'v1'):
+        # a VoltageDivider; the QDac does division_value times the step
+        step = step*param.division_value
+        param = param.v1
+
+    instrument = getattr(param, '_instrument', None)
+    match = re.match(r'ch(\d+)_v$', param.name)
+    if instrument is None or match is None:
+        return step, None
+
+    slope_name = 'ch{:02}_slope'.format(int(match.group(1)))
+    if slope_name not in instrument.parameters:
+        return step, None
+
+    return step, instrument.parameters[slope_name].get_latest()
+
+
+def lockin_filter(meas_params):
+    """
+    The slowest lock-in filter among the measured parameters
+
+    Returns:
+        tuple (Optional[float], int): The time constant (s) and the filter
+            slope (dB/oct) of the slowest lock-in. (None, 24) if no lock-in
+            is measured.
+    """
+    slowest = (None, 24)
+    for param in meas_params:
+        lockin = getattr(param, '_instrument', None)
+        if lockin is None or not hasattr(lockin, 'time_constant'):
+            continue
+        tau = lockin.time_constant()
+        filter_slope = lockin.filter_slope()
+        if (slowest[0] is None or
+                tau*lockin_settle_factor(filter_slope, 0.01) >
+                slowest[0]*lockin_settle_factor(slowest[1], 0.01)):
+            slowest = (tau, filter_slope)
+
+    return slowest
+
+
+def sweep_settle_time(set_param, start, stop, n_points, meas_params,
+                      step=None):
+    """
+    The settle time per point of a sweep
+
+    Args:
+        set_param (Parameter): The swept parameter
+        start (float): Start of the sweep
+        stop (float): End of the sweep
+        n_points (int): Number of points
+        meas_params (Sequence[Parameter]): The measured parameters (any
+            lock-ins among them determine the filter settling)
+        step (Optional[float]): The step to settle, if not that between
+            two points (e.g. the jump back to the start of a row)
+
+    Returns:
+        float: The settle time (s)
+    """
+    if step is None:
+        step = abs(stop-start)/max(n_points-1, 1)
+    span = abs(stop-start)
+    fraction = min(step/span, 1) if span > 0 else 1
+    step, slope = qdac_step(set_param, step)
+    tau, filter_slope = lockin_filter(meas_params)
+
+    return settle_time(step, slope=slope, tau=tau, filter_slope=filter_slope,
+                       fraction=fraction)
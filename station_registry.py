@@ -0,0 +1,197 @@
+# Module file for a config-driven station with lazy instrument connection.
+# The instruments are described in station.config (one section per
+# instrument) instead of being hardcoded, and each instrument is only
+# instantiated (and connected) the first time it is looked up in the
+# station, e.g. qc.Station.default['qdac'].
+#
+# A section looks like
+#
+#   [lockin_topo]
+#   driver = qcodes.instrument_drivers.stanford_research.SR830.SR830
+#   subclass = modules.Majorana.Experiment_init.SR830_T10
+#   address = GPIB10::7::INSTR
+#
+# driver is the QCoDeS driver, subclass (optional) our T10 version of it,
+# which is then what gets instantiated. 'sample config = True' passes the
+# default Config as the config argument. Any other key is passed on as a
+# keyword argument (parsed as a Python literal if possible).
+
+import ast
+from configparser import ConfigParser
+import importlib
+import logging
+
+import qcodes as qc
+from qcodes.utils.configreader import Config
+
+log = logging.getLogger(__name__)
+
+_RESERVED_KEYS = ('driver', 'subclass', 'address', 'sample config')
+
+
+def _import_class(path):
+    """
+    Import a class from its dotted path, e.g. 'package.module.Class'
+    """
+    module_name, _, class_name = path.rpartition('.')
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name)
+
+
+def _parse_value(value):
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        return value
+
+
+def read_station_config(filename):
+    """
+    Read the instrument descriptions of a station config file
+
+    Returns:
+        dict: instrument name: dict of the section
+    """
+    parser = ConfigParser()
+    # instrument names and keyword arguments are case sensitive
+    parser.optionxform = str
+    if not parser.read(filename):
+        raise FileNotFoundError('No station config at {}'.format(filename))
+
+    return {name: dict(parser[name]) for name in parser.sections()}
+
+
+def make_instrument(name, spec):
+    """
+    Instantiate an instrument from its description
+
+    Args:
+        name (str): The instrument name
+        spec (dict): The section of the station config
+
+    Returns:
+        Instrument: The instrument
+    """
+    driver = _import_class(spec['driver'])
+    cls = driver
+    if 'subclass' in spec:
+        cls = _import_class(spec['subclass'])
+        if not issubclass(cls, driver):
+            raise ValueError('{} is not a {}.'.format(spec['subclass'],
+                                                      spec['driver']))
+
+    kwargs = {key: _parse_value(value) for key, value in spec.items()
+              if key not in _RESERVED_KEYS}
+    if _parse_value(spec.get('sample config', 'False')):
+        kwargs['config'] = Config.default
+
+    log.info('Connecting to {} ({})'.format(name, cls.__name__))
+
+    return cls(name, spec['address'], **kwargs)
+
+
+class LazyComponents(dict):
+    """
+    The components of a LazyStation. Looking up a described but not yet
+    connected instrument connects it.
+    """
+
+    def __init__(self, components, specs):
+        super().__init__(components)
+        self.specs = specs
+
+    def __missing__(self, key):
+        if key not in self.specs:
+            raise KeyError(key)
+        instrument = make_instrument(key, self.specs[key])
+        self[key] = instrument
+        return instrument
+
+    def __contains__(self, key):
+        return super().__contains__(key) or key in self.specs
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    @property
+    def pending(self):
+        """
+        The described instruments that are not connected yet
+        """
+        return sorted(name for name in self.specs
+                      if not super().__contains__(name))
+
+
+class LazyStation(qc.Station):
+    """
+    A station whose instruments are described in a station config file
+    and connected on first access.
+
+    Iterating over the components (e.g. for the snapshot) only sees the
+    instruments connected so far.
+
+    Args:
+        filename (str): The path to the station config file
+        *components: Instruments or other components to add right away
+        **kwargs: Passed on to Station (e.g. default)
+    """
+
+    def __init__(self, filename, *components, **kwargs):
+        super().__init__(*components, **kwargs)
+        self.config_filename = filename
+        self.components = LazyComponents(self.components,
+                                         read_station_config(filename))
+
+    def connect(self, *names):
+        """
+        Connect instruments right away. Connects all if no names are given.
+        """
+        if not names:
+            names = self.components.pending
+        for name in names:
+            self.components[name]
+
+    @property
+    def pending(self):
+        return self.components.pending
+
+
+class LazyInstrument:
+    """
+    A stand-in for an instrument of a LazyStation, for the interactive
+    globals of Experiment_init (qdac, zi, ...). The instrument is connected
+    the first time any of its attributes is used; from then on everything
+    is passed on to it.
+
+    Args:
+        station (LazyStation): The station
+        name (str): The name of the instrument in the station
+    """
+
+    def __init__(self, station, name):
+        self._station = station
+        self._name = name
+
+    @property
+    def instrument(self):
+        """
+        The instrument (connected if need be)
+        """
+        return self._station.components[self._name]
+
+    def __getattr__(self, attr):
+        return getattr(self.instrument, attr)
+
+    def __setattr__(self, attr, value):
+        if attr in ('_station', '_name'):
+            super().__setattr__(attr, value)
+        else:
+            setattr(self.instrument, attr, value)
+
+    def __call__(self, *args, **kwargs):
+        return self.instrument(*args, **kwargs)
+
+    def __repr__(self):
+        if self._name in self._station.pending:
+            return '<{} (not connected)>'.format(self._name)
+        return repr(self.instrument)
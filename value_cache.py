@@ -0,0 +1,201 @@
+# Module file for a station-wide cache of parameter values.
+# Every value read or set through the cache is stored with the time and
+# the function that produced it. A get within the maximum age of the
+# instrument is answered from the cache, so that e.g. computing a ramp
+# time does not cost a serial query of the current voltage every time.
+# Values set or read outside the cache (e.g. by a qcodes Loop) are not
+# missed: the parameter's own latest value is used whenever it is newer
+# than the cache entry.
+
+from collections import namedtuple
+import sys
+import threading
+import time
+
+CacheEntry = namedtuple('CacheEntry', ['value', 'timestamp', 'source'])
+
+# Maximum age (s) of cached values per instrument. The QDac voltages only
+# change when we set them, so they can be trusted for a while; the limit
+# covers changes made behind qcodes' back (e.g. on the front panel).
+DEFAULT_MAX_AGES = {'qdac': 60}
+DEFAULT_MAX_AGE = 1
+
+
+def _key(param):
+    instrument = getattr(param, '_instrument', None)
+    instrument_name = instrument.name if instrument is not None else None
+    return instrument_name, param.name
+
+
+def _latest_entry(param):
+    """
+    The parameter's own latest value as a cache entry, or None. qcodes
+    updates it on every set and get of the parameter.
+    """
+    timestamp = getattr(param, '_latest_ts', None)
+    if timestamp is None:
+        return None
+    return CacheEntry(param._latest_value, timestamp.timestamp(),
+                      'parameter')
+
+
+def _caller():
+    # the function calling into the cache (two frames up)
+    return sys._getframe(2).f_code.co_name
+
+
+class ValueCache:
+    """
+    A cache of parameter values with a maximum age per instrument and
+    hit/miss statistics.
+
+    Args:
+        max_ages (Optional[dict]): instrument name: maximum age (s).
+            Defaults to DEFAULT_MAX_AGES.
+        default_max_age (float): The maximum age for other instruments
+        isdefault (Optional[bool]): Whether this is the default cache
+            object (see value_cache). Default: True.
+
+    Attributes:
+        default (Union[None, ValueCache]): A reference to the default
+            cache object, if it exists. Else None.
+    """
+
+    default = None
+
+    def __init__(self, max_ages=None, default_max_age=DEFAULT_MAX_AGE,
+                 isdefault=True):
+
+        if isdefault:
+            ValueCache.default = self
+
+        self.max_ages = dict(DEFAULT_MAX_AGES if max_ages is None
+                             else max_ages)
+        self.default_max_age = default_max_age
+
+        self._entries = {}
+        self._hits = {}
+        self._misses = {}
+        self._lock = threading.Lock()
+
+    def max_age(self, instrument_name):
+        return self.max_ages.get(instrument_name, self.default_max_age)
+
+    def set_max_age(self, instrument_name, max_age):
+        """
+        Set the maximum age (s) of the cached values of an instrument.
+        0 disables the cache for it.
+        """
+        self.max_ages[instrument_name] = max_age
+
+    def entry(self, param):
+        """
+        The most recent known value of a parameter: the cache entry, or the
+        parameter's own latest value if that is newer. None if neither
+        exists.
+        """
+        with self._lock:
+            entry = self._entries.get(_key(param))
+        latest = _latest_entry(param)
+        if latest is not None and (entry is None or
+                                   latest.timestamp > entry.timestamp):
+            return latest
+        return entry
+
+    def is_fresh(self, param, max_age=None):
+        """
+        Whether the parameter has a cached value younger than max_age
+        (default: the maximum age of its instrument)
+        """
+        entry = self.entry(param)
+        if entry is None:
+            return False
+        if max_age is None:
+            max_age = self.max_age(_key(param)[0])
+        return time.time() - entry.timestamp <= max_age
+
+    def record(self, param, value, source=None):
+        """
+        Store a value read or set by other means than the cache
+        """
+        if source is None:
+            source = _caller()
+        with self._lock:
+            self._entries[_key(param)] = CacheEntry(value, time.time(),
+                                                    source)
+
+    def get(self, param, max_age=None):
+        """
+        The value of a parameter, from the cache if fresh enough, else
+        from the instrument
+
+        Args:
+            param (Parameter): The parameter
+            max_age (Optional[float]): Override the maximum age of the
+                instrument (s)
+        """
+        instrument_name = _key(param)[0]
+        if self.is_fresh(param, max_age):
+            with self._lock:
+                self._hits[instrument_name] = (
+                    self._hits.get(instrument_name, 0) + 1)
+            return self.entry(param).value
+
+        with self._lock:
+            self._misses[instrument_name] = (
+                self._misses.get(instrument_name, 0) + 1)
+        value = param.get()
+        self.record(param, value, source=_caller())
+
+        return value
+
+    def set(self, param, value):
+        """
+        Set a parameter and cache the value
+        """
+        param.set(value)
+        self.record(param, value, source=_caller())
+
+    def invalidate(self, instrument_name=None):
+        """
+        Forget the cached values of an instrument (or of all instruments),
+        e.g. after touching the front panel
+        """
+        with self._lock:
+            if instrument_name is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries
+                            if key[0] == instrument_name]:
+                    del self._entries[key]
+
+    def stats(self):
+        """
+        Hit/miss statistics per instrument
+
+        Returns:
+            dict: instrument name: {'hits', 'misses', 'hit_rate'}
+        """
+        with self._lock:
+            names = set(self._hits) | set(self._misses)
+            output = {}
+            for name in names:
+                hits = self._hits.get(name, 0)
+                misses = self._misses.get(name, 0)
+                output[name] = {'hits': hits, 'misses': misses,
+                                'hit_rate': hits/(hits+misses)}
+        return output
+
+    def reset_stats(self):
+        with self._lock:
+            self._hits.clear()
+            self._misses.clear()
+
+
+def value_cache():
+    """
+    The default (station-wide) cache, made on first use
+    """
+    if ValueCache.default is None:
+        ValueCache()
+    return ValueCache.default
@@ -0,0 +1,272 @@
+# Module file for continuous ("video mode") acquisition of 2D frames.
+# The instruments are configured once; a background thread then keeps
+# pulling frames into a ring buffer that live viewers (e.g. view) read
+# from. Only frames that are explicitly snapshotted end up in a dataset.
+
+from collections import deque
+import logging
+import threading
+import time
+
+import numpy as np
+import qcodes as qc
+from qcodes.data.data_array import DataArray
+
+log = logging.getLogger(__name__)
+
+
+class VideoMode:
+    """
+    Continuously acquire frames from a 2D ArrayParameter (e.g. the ZI's
+    scope_frame) into a ring buffer of the most recent frames.
+
+    Args:
+        frame_param (ArrayParameter): The parameter returning one frame per
+            get. Its setpoints must be made before starting.
+        buffer_size (int): Number of recent frames to keep
+        averages (int): Number of frames in the running average. 1 means
+            no averaging.
+        on_stop (Optional[callable]): Called when the acquisition stops,
+            e.g. to switch the generator outputs off.
+
+    Attributes:
+        error (Optional[Exception]): The exception that ended the
+            acquisition, if any. It is re-raised by stop, view and
+            snapshot.
+    """
+
+    def __init__(self, frame_param, buffer_size=10, averages=1,
+                 on_stop=None):
+
+        self.frame_param = frame_param
+        self.buffer = deque(maxlen=buffer_size)
+        self.averages = averages
+        self.on_stop = on_stop
+
+        self.frames_acquired = 0
+        self.frames_dropped = 0
+        self._average = None
+        self._n_averaged = 0
+        self._timestamps = deque(maxlen=20)
+        self.error = None
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def fps(self):
+        """
+        The recent acquisition rate (frames/s)
+        """
+        with self._lock:
+            stamps = list(self._timestamps)
+        if len(stamps) < 2:
+            return 0.0
+        return (len(stamps)-1)/(stamps[-1]-stamps[0])
+
+    def _acquire(self):
+        try:
+            frame = np.asarray(self.frame_param.get(), dtype=float)
+        except (RuntimeError, ValueError, TimeoutError) as e:
+            # an incomplete or failed acquisition; keep streaming, but log
+            # the first one in full
+            if self.frames_dropped == 0:
+                log.warning('Dropped a frame, acquisition failed. Further '
+                            'drops are logged at debug level.',
+                            exc_info=True)
+            else:
+                log.debug('Dropped a frame: {!r}'.format(e))
+            self.frames_dropped += 1
+            return
+
+        if frame.shape != tuple(self.frame_param.shape):
+            self.frames_dropped += 1
+            return
+
+        with self._lock:
+            self._n_averaged = min(self._n_averaged+1, self.averages)
+            if self._average is None or self._n_averaged == 1:
+                self._average = frame
+            else:
+                self._average = (self._average +
+                                 (frame-self._average)/self._n_averaged)
+
+            self.frames_acquired += 1
+            self._timestamps.append(time.perf_counter())
+            self.buffer.append((self.frames_acquired, frame, self._average))
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                self._acquire()
+        except Exception as e:
+            log.exception('Video mode acquisition failed')
+            self.error = e
+
+    def _raise_error(self):
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise error
+
+    def start(self):
+        """
+        Start acquiring in the background
+        """
+        if self.running:
+            return
+        self.error = None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop acquiring. The ring buffer is kept. Re-raises the exception
+        that ended the acquisition, if any.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.on_stop is not None:
+            self.on_stop()
+        self._raise_error()
+
+    def reset_average(self):
+        """
+        Restart the running average, e.g. after moving a gate
+        """
+        with self._lock:
+            self._n_averaged = 0
+
+    def latest(self, averaged=True):
+        """
+        The most recent frame.
+
+        Args:
+            averaged (bool): Whether to return the running average
+                rather than the raw frame
+
+        Returns:
+            tuple (int, np.ndarray): the frame number and the frame.
+                (0, None) if no frame has been acquired yet.
+        """
+        with self._lock:
+            if not self.buffer:
+                return 0, None
+            number, frame, average = self.buffer[-1]
+        return number, average if averaged else frame
+
+    def view(self, averaged=True, max_fps=10):
+        """
+        Show the most recent frame of the ring buffer, refreshed until the
+        window is closed or the acquisition stops. Blocks; the drawing is
+        done in the calling thread, the frames come from the acquisition
+        thread.
+
+        Args:
+            averaged (bool): Whether to show the running average rather
+                than the raw frames
+            max_fps (float): The maximal refresh rate (frames/s)
+
+        Returns:
+            Figure: The matplotlib figure
+        """
+        # imported here to keep matplotlib out of the acquisition imports
+        import matplotlib.pyplot as plt
+
+        param = self.frame_param
+        slow = np.asarray(param.setpoints[0], dtype=float)
+        fast = np.asarray(param.setpoints[1], dtype=float)[0]
+        extent = [fast[0], fast[-1], slow[0], slow[-1]]
+        slow_label, fast_label = param.setpoint_labels or ('slow', 'fast')
+
+        fig, ax = plt.subplots()
+        ax.set_xlabel(fast_label)
+        ax.set_ylabel(slow_label)
+        image = None
+        shown = 0
+
+        while self.running and plt.fignum_exists(fig.number):
+            number, frame = self.latest(averaged=averaged)
+            if frame is not None and number != shown:
+                if image is None:
+                    image = ax.imshow(frame, aspect='auto', origin='lower',
+                                      extent=extent)
+                    fig.colorbar(image, ax=ax)
+                else:
+                    image.set_data(frame)
+                    image.autoscale()
+                ax.set_title('Frame {} ({:.1f} fps)'.format(number,
+                                                            self.fps))
+                shown = number
+            plt.pause(1/max_fps)
+
+        self._raise_error()
+
+        return fig
+
+    def stats(self):
+        """
+        Throughput and dropped-frame counters
+        """
+        return {'fps': self.fps,
+                'frames_acquired': self.frames_acquired,
+                'frames_dropped': self.frames_dropped,
+                'averages': self.averages}
+
+    def snapshot(self, name='video_snapshot', averaged=True):
+        """
+        Persist the most recent frame as a dataset.
+
+        Args:
+            name (str): The name of the dataset
+            averaged (bool): Whether to save the running average rather
+                than the raw frame
+
+        Returns:
+            DataSet: The saved dataset
+        """
+        self._raise_error()
+
+        number, frame = self.latest(averaged=averaged)
+        if frame is None:
+            raise ValueError('No frame acquired yet.')
+
+        param = self.frame_param
+        slow_name, fast_name = param.setpoint_names or ('slow', 'fast')
+        slow_label, fast_label = (param.setpoint_labels or
+                                  (slow_name, fast_name))
+        slow_unit, fast_unit = param.setpoint_units or ('', '')
+
+        slow = DataArray(name=slow_name, array_id=slow_name,
+                         label=slow_label, unit=slow_unit, is_setpoint=True,
+                         preset_data=np.array(param.setpoints[0]))
+        slow.set_arrays = (slow,)
+        fast = DataArray(name=fast_name, array_id=fast_name,
+                         label=fast_label, unit=fast_unit, is_setpoint=True,
+                         preset_data=np.array(param.setpoints[1]))
+        fast.set_arrays = (slow, fast)
+        data_array = DataArray(name=param.name, array_id=param.name,
+                               label=param.label, unit=param.unit,
+                               preset_data=frame, set_arrays=(slow, fast))
+
+        arrays = (slow, fast, data_array)
+        for arr in arrays:
+            arr.modified_range = (0, arr.ndarray.size-1)
+
+        data = qc.new_data(arrays=arrays, name=name)
+        data.add_metadata({'video_mode': dict(self.stats(),
+                                              frame_number=number,
+                                              averaged=averaged),
+                           'frame_param': param.snapshot()})
+        data.write(write_metadata=True)
+        data.finalize()
+
+        return data
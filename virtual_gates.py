@@ -0,0 +1,239 @@
+# Module file for virtual gates on the QDac.
+# A virtual gate moves several physical QDac channels at once, e.g. a dot
+# plunger while compensating the sensor plunger and the cutters. The
+# compensation matrix is read from the [Virtual Gates] section of the
+# config file, one virtual gate per line:
+#
+#   topo left plunger = 33: 1, 38: -0.12, 32: -0.03
+#
+# i.e. channel: coefficient for every physical channel the virtual gate
+# moves. The virtual gates are parameters of the QDac (named vg_..., e.g.
+# qdac.vg_topo_left_plunger), so they can be swept like any channel. When
+# swept, the physical setpoints of the whole sweep are computed at once
+# and validated against the channel ranges before anything is set.
+
+import numpy as np
+from qcodes.instrument.parameter import Parameter
+
+from modules.Majorana.value_cache import value_cache
+
+# Sweep setpoints are matched to their precomputed deltas to 1 nV
+DELTA_KEY_DECIMALS = 9
+
+
+def _parse_column(spec):
+    """
+    Parse '33: 1, 38: -0.12' into {33: 1.0, 38: -0.12}
+    """
+    column = {}
+    for entry in spec.split(','):
+        chan, coefficient = entry.split(':')
+        column[int(chan)] = float(coefficient)
+    return column
+
+
+def parameter_name(label):
+    """
+    The parameter name of a virtual gate, e.g. 'topo left plunger' ->
+    'vg_topo_left_plunger'
+    """
+    return 'vg_' + '_'.join(label.lower().split())
+
+
+class VirtualGates:
+    """
+    The virtual gates of a QDac.
+
+    The physical voltages are P = P0 + M V, where M is the compensation
+    matrix (physical channels x virtual gates), V the virtual gate
+    voltages and P0 the physical voltages at the origin (see
+    reset_origin), where all virtual gates are 0.
+
+    Args:
+        qdac (QDac): The QDac
+        columns (dict): virtual gate label: {channel: coefficient}
+    """
+
+    def __init__(self, qdac, columns):
+        self.qdac = qdac
+        self.labels = list(columns.keys())
+        self.channels = sorted(set(chan for column in columns.values()
+                                   for chan in column))
+
+        self.matrix = np.zeros((len(self.channels), len(self.labels)))
+        for col, label in enumerate(self.labels):
+            for chan, coefficient in columns[label].items():
+                self.matrix[self.channels.index(chan), col] = coefficient
+
+        self.physical_params = [qdac.parameters['ch{:02}_v'.format(chan)]
+                                for chan in self.channels]
+        self.virtual = np.zeros(len(self.labels))
+        self.origin = None
+        self._base = None
+        self._base_key = None
+
+        self.parameters = [VirtualGate(self, index) for index in
+                           range(len(self.labels))]
+
+    def reset_origin(self):
+        """
+        Make the present physical voltages the origin, i.e. all virtual
+        gates 0. The voltages are read from the QDac, since a cached value
+        may miss a change made behind qcodes' back.
+        """
+        cache = value_cache()
+        origin = []
+        for param in self.physical_params:
+            value = param.get()
+            cache.record(param, value)
+            origin.append(value)
+        self.origin = np.array(origin)
+        self._base_key = None
+        self.virtual = np.zeros(len(self.labels))
+
+    def physical(self, virtual):
+        """
+        The physical voltages for one or several (rows) virtual settings
+        """
+        if self.origin is None:
+            self.reset_origin()
+        return self.origin + np.asarray(virtual) @ self.matrix.T
+
+    def validate(self, physical):
+        """
+        Check physical setpoints (one row per point) against the channel
+        validators before any of them is set
+        """
+        physical = np.atleast_2d(physical)
+        for param, column in zip(self.physical_params, physical.T):
+            param.validate(column.min())
+            param.validate(column.max())
+
+    def apply(self, physical):
+        """
+        Set the physical voltages. Only the channels that change are
+        written, back-to-back (the QDac has no multi-channel set). The
+        comparison is with the channels' own latest values, so that sets
+        made outside the virtual gates are not missed.
+        """
+        cache = value_cache()
+        for param, value in zip(self.physical_params, physical):
+            if param.get_latest() != value:
+                cache.set(param, value)
+
+    def set_virtual(self, index, value, delta=None):
+        """
+        Set a virtual gate. delta, the physical change due to this gate
+        alone, may be given if it is precomputed.
+        """
+        if self.origin is None:
+            self.reset_origin()
+
+        virtual = self.virtual.copy()
+        virtual[index] = value
+
+        # the contribution of all other gates only changes when they move
+        others = virtual.copy()
+        others[index] = 0
+        key = (index, others.tobytes())
+        if key != self._base_key:
+            self._base = self.origin + self.matrix @ others
+            self._base_key = key
+
+        if delta is None:
+            delta = self.matrix[:, index]*value
+        physical = self._base + delta
+
+        self.validate(physical)
+        self.apply(physical)
+        self.virtual = virtual
+
+    def sweep_deltas(self, index, values):
+        """
+        The physical changes due to one virtual gate (one row per value)
+        for a sweep, validated for the whole sweep with the other gates
+        staying where they are.
+        """
+        deltas = np.outer(values, self.matrix[:, index])
+        virtual = np.tile(self.virtual, (len(values), 1))
+        virtual[:, index] = 0
+        self.validate(self.physical(virtual) + deltas)
+        return deltas
+
+
+class VirtualGate(Parameter):
+    """
+    A virtual gate (see VirtualGates). Sweeps precompute and validate all
+    their physical setpoints.
+    """
+
+    def __init__(self, gates, index):
+        self.gates = gates
+        self.index = index
+        label = gates.labels[index]
+        super().__init__(name=parameter_name(label), instrument=gates.qdac,
+                         label=label, unit='V')
+        self.has_get = True
+        self.has_set = True
+        self._deltas = {}
+
+    def sweep(self, start, stop, step=None, num=None):
+        sweep_values = super().sweep(start, stop, step=step, num=num)
+        values = list(sweep_values)
+        deltas = self.gates.sweep_deltas(self.index, values)
+        self._deltas = {self._key(value): delta
+                        for value, delta in zip(values, deltas)}
+        return sweep_values
+
+    @staticmethod
+    def _key(value):
+        # setpoints computed slightly differently (e.g. 0.1+0.2 and 0.3)
+        # must find the same precomputed delta
+        return round(float(value), DELTA_KEY_DECIMALS)
+
+    def physical_steps(self, step):
+        """
+        The physical channel steps caused by a step of this gate
+        """
+        return self.gates.matrix[:, self.index]*step
+
+    def get(self):
+        return self.gates.virtual[self.index]
+
+    def set(self, value):
+        self.gates.set_virtual(self.index, value,
+                               delta=self._deltas.get(self._key(value)))
+
+
+def load_virtual_gates(qdac, config):
+    """
+    Make the virtual gates of the config file and add them to the QDac's
+    parameters. Replaces any previously loaded virtual gates.
+
+    Args:
+        qdac (QDac): The QDac
+        config (Config): The config
+
+    Returns:
+        Optional[VirtualGates]: None if the config has no virtual gates
+    """
+    old = getattr(qdac, 'virtual_gates', None)
+    if old is not None:
+        for param in old.parameters:
+            qdac.parameters.pop(param.name, None)
+
+    try:
+        section = config.get('Virtual Gates')
+    except KeyError:
+        section = {}
+    if not section:
+        qdac.virtual_gates = None
+        return None
+
+    columns = {label: _parse_column(spec) for label, spec in section.items()}
+    gates = VirtualGates(qdac, columns)
+    for param in gates.parameters:
+        qdac.parameters[param.name] = param
+
+    qdac.virtual_gates = gates
+    return gates
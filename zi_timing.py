@@ -0,0 +1,170 @@
+# Module file for the timing calculations of the fast measurements.
+# Everything in here is pure (no instrument is ever queried), so the
+# full ZI + Keysight + AWG timing can be worked out (and checked) offline
+# before touching any hardware.
+
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+# The sample rates of the ZI UHF-LI scope, as numbers and as the
+# strings used by the QCoDeS driver
+ZI_SAMPLE_RATES = 1.8e9/2**np.arange(17)
+ZI_SAMPLE_RATE_STRINGS = ('1.80 GHz', '900 MHz', '450 MHz', '225 MHz',
+                          '113 MHz', '56.2 MHz', '28.1 MHz', '14.0 MHz',
+                          '7.03 MHz', '3.50 MHz', '1.75 MHz', '880 kHz',
+                          '440 kHz', '220 kHz', '110 kHz', '54.9 kHz',
+                          '27.5 kHz')
+# The shortest scope record the driver accepts
+ZI_MIN_SCOPE_LENGTH = 4096
+# The default point budget per scope segment: the scope memory per record
+# without the DIG option
+ZI_MAX_SCOPE_LENGTH = 16384
+# The AWG5014 sample rate used for the pulses; the AWG cycle is a whole
+# number of its samples
+AWG_SAMPLE_RATE = 1e9
+
+
+FastTiming = namedtuple('FastTiming',
+                        ['SRstring',  # ZI scope sample rate string
+                         'samplingrate',  # ZI scope sample rate (Sa/s)
+                         'scope_length',  # ZI scope points per segment
+                         'scope_duration',  # duration of a segment (s)
+                         'trigger_holdoff',  # ZI trigger holdoff (s)
+                         'trigger_delay',  # ZI trigger delay (s)
+                         'segments',  # no. of ZI scope segments
+                         'period',  # time between two ZI triggers (s)
+                         'frame_time',  # time to acquire all segments (s)
+                         'key_frequency',  # Keysight sawtooth freq. (Hz)
+                         'ramp_symmetry',  # Keysight ramp symmetry (%)
+                         'phase',  # Keysight phase (deg)
+                         'burst_frequency',  # Keysight single ramp over
+                                             # all segments (Hz)
+                         'awg_cycletime'])  # min. AWG pulse cycle (s),
+                                            # whole AWG samples
+
+
+def samplingrate_from_string(SRstring):
+    """
+    Convert a ZI scope sample rate string to a number (Sa/s)
+
+    Args:
+        SRstring (str): The sample rate as used by the driver, e.g. '14.0 MHz'
+    """
+    try:
+        return ZI_SAMPLE_RATES[ZI_SAMPLE_RATE_STRINGS.index(SRstring)]
+    except ValueError:
+        raise ValueError('Unknown ZI sample rate: {}. Must be one of '
+                         '{}.'.format(SRstring, ZI_SAMPLE_RATE_STRINGS))
+
+
+@lru_cache(maxsize=256)
+def closest_samplingrate(meastime, npts):
+    """
+    Given a number of points to measure, and a desired measurement time,
+    find the measurement time closest to the given one that the ZI UHF-LI can
+    actually realise.
+
+    Args:
+        meastime (float): The desired measurement time
+        npts (int): The desired number of points
+
+    Returns:
+        tuple (float, str): A tuple with the new measurement time and
+            a string with the sample rate achieving this
+    """
+    realtimes = npts/ZI_SAMPLE_RATES
+    index = np.abs(meastime-realtimes).argmin()
+
+    # Do some rounding for safety
+    newtime = float('{:.4e}'.format(realtimes[index]))
+
+    return newtime, ZI_SAMPLE_RATE_STRINGS[index]
+
+
+@lru_cache(maxsize=256)
+def fast_timing(SRstring, scope_length, trigger_holdoff, trigger_delay,
+                segments=1):
+    """
+    The full timing for a given ZI scope setting.
+
+    The Keysight sawtooth must last the scope duration plus the trigger
+    holdoff plus the trigger delay, and the holdoff is spent in the
+    falling part of the ramp.
+
+    Args:
+        SRstring (str): The ZI scope sample rate string
+        scope_length (int): The number of points per scope segment
+        trigger_holdoff (float): The ZI trigger holdoff (s)
+        trigger_delay (float): The ZI trigger delay (s), i.e. the rise time
+            of the trigger signal
+        segments (int): The number of scope segments
+
+    Returns:
+        FastTiming: the complete and consistent timing
+    """
+    samplingrate = samplingrate_from_string(SRstring)
+    scope_length = int(scope_length)
+
+    if scope_length < ZI_MIN_SCOPE_LENGTH:
+        raise ValueError('Scope length too short. Must be at least '
+                         '{}.'.format(ZI_MIN_SCOPE_LENGTH))
+
+    scope_duration = scope_length/samplingrate
+    period = trigger_holdoff + scope_duration + trigger_delay
+    asym = trigger_holdoff/period  # dead time / meas. time
+    # the AWG can only play whole samples, so round the period up
+    awg_cycletime = np.ceil(period*AWG_SAMPLE_RATE - 1e-6)/AWG_SAMPLE_RATE
+
+    return FastTiming(SRstring=SRstring,
+                      samplingrate=samplingrate,
+                      scope_length=scope_length,
+                      scope_duration=scope_duration,
+                      trigger_holdoff=trigger_holdoff,
+                      trigger_delay=trigger_delay,
+                      segments=segments,
+                      period=period,
+                      frame_time=segments*period,
+                      key_frequency=1/period,
+                      ramp_symmetry=100*(1-asym),
+                      phase=180*(1+asym),
+                      burst_frequency=1/(segments*period),
+                      awg_cycletime=float(awg_cycletime))
+
+
+@lru_cache(maxsize=256)
+def solve_timing(meastime, trigger_holdoff, trigger_delay, segments=1,
+                 max_points=ZI_MAX_SCOPE_LENGTH):
+    """
+    Solve for the ZI scope setting realising a desired measurement time
+    within a point budget and return the full timing.
+
+    For every sample rate the scope length closest to the measurement time
+    (within ZI_MIN_SCOPE_LENGTH and max_points) is worked out, and the
+    sample rate realising the measurement time most closely is chosen. Of
+    equally close ones, the highest sample rate (most points) wins.
+
+    Args:
+        meastime (float): The desired duration of each segment (s)
+        trigger_holdoff (float): The ZI trigger holdoff (s)
+        trigger_delay (float): The ZI trigger delay (s)
+        segments (int): The number of scope segments
+        max_points (int): The maximal number of points per segment
+
+    Returns:
+        FastTiming: the complete and consistent timing
+    """
+    if max_points < ZI_MIN_SCOPE_LENGTH:
+        raise ValueError('Point budget too small. Must be at least '
+                         '{}.'.format(ZI_MIN_SCOPE_LENGTH))
+
+    lengths = np.clip(np.round(meastime*ZI_SAMPLE_RATES),
+                      ZI_MIN_SCOPE_LENGTH, max_points)
+    errors = np.abs(lengths/ZI_SAMPLE_RATES - meastime)
+    # the rates are sorted in descending order, so argmin takes the
+    # highest of equally good ones
+    index = int(np.argmin(np.round(errors, 12)))
+
+    return fast_timing(ZI_SAMPLE_RATE_STRINGS[index], int(lengths[index]),
+                       trigger_holdoff, trigger_delay, segments)